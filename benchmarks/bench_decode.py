@@ -0,0 +1,81 @@
+"""
+Compares reading a large query response through ResultSet with the raw decoding paths of query_raw,
+for json, csv and msgpack responses.
+
+    python -m benchmarks.bench_decode
+"""
+import csv
+import io
+import json
+import timeit
+
+from influxdb.client import _msgpack_parse_hook
+from influxdb.resultset import ResultSet
+
+from influxpy import decoders
+from influxpy.queryset import InfluxQuerySet
+from benchmarks.bench_rows import make_raw
+
+
+def make_body(count):
+    """A response as recorded from influxdb for a query over count points."""
+    return json.dumps({'results': [make_raw(count)]}).encode('utf-8')
+
+
+def make_csv_body(count):
+    serie = make_raw(count)['series'][0]
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(['name', 'tags'] + serie['columns'])
+    tags = ','.join('{}={}'.format(key, value) for key, value in sorted(serie['tags'].items()))
+    for index, values in enumerate(serie['values']):
+        writer.writerow([serie['name'], tags, 1513065600000000000 + index * 1000000000] + values[1:])
+    return output.getvalue().encode('utf-8')
+
+
+def make_msgpack_body(count):
+    # query_raw asks msgpack timestamps as integers.
+    raw = make_raw(count)
+    for index, values in enumerate(raw['series'][0]['values']):
+        values[0] = 1513065600000000000 + index * 1000000000
+    return decoders.msgpack.packb({'results': [raw]})
+
+
+def unpack(body):
+    # InfluxDBClient.request unpacks msgpack bodies, query_raw reuses the document.
+    return decoders.msgpack.unpackb(body, ext_hook=_msgpack_parse_hook, raw=False)
+
+
+def result_set(body):
+    # InfluxDBClient.query: requests' json decoding then a ResultSet per statement.
+    results = [ResultSet(result) for result in json.loads(body.decode('utf-8'))['results']]
+    return list(InfluxQuerySet._series_from_raw(results[0].raw))
+
+
+def raw(loads):
+    def decode(body):
+        return list(InfluxQuerySet._series_from_raw(loads(body)['results'][0]))
+    return decode
+
+
+def main(count=100000, repeat=5):
+    body = make_body(count)
+    candidates = [('ResultSet', result_set, body), ('raw json', raw(json.loads), body)]
+    if decoders.orjson is not None:
+        candidates.append(('raw orjson', raw(decoders.orjson.loads), body))
+    if decoders.ujson is not None:
+        candidates.append(('raw ujson', raw(decoders.ujson.loads), body))
+    candidates.append(('csv', raw(decoders.decode_csv), make_csv_body(count)))
+    candidates.append(('csv epoch', raw(lambda body: decoders.decode_csv(body, epoch='ns')), make_csv_body(count)))
+    if decoders.msgpack is not None:
+        candidates.append(('msgpack', raw(lambda body: decoders.format_times(unpack(body))), make_msgpack_body(count)))
+        candidates.append(('msgpack epoch', raw(unpack), make_msgpack_body(count)))
+
+    for name, func, body in candidates:
+        best = min(timeit.repeat(lambda: func(body), number=1, repeat=repeat))
+        print('{name:<13} {usec:6.3f} us/point {size:6.1f} bytes/point'.format(
+            name=name, usec=best / count * 1e6, size=len(body) / count))
+
+
+if __name__ == '__main__':
+    main()
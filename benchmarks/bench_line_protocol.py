@@ -0,0 +1,53 @@
+"""
+Compares the compiled line protocol encoder with the dict points serialized by the influxdb library.
+
+    python -m benchmarks.bench_line_protocol
+"""
+import timeit
+from datetime import datetime, timedelta
+
+from influxdb.line_protocol import make_lines
+
+from influxpy.fields import InfluxField, InfluxTag
+from influxpy.model import InfluxMeasurement
+
+
+class ServerMeasurement(InfluxMeasurement):
+    measurement = 'server'
+
+    cpu_percent = InfluxField()
+    memory_free = InfluxField()
+    memory_used = InfluxField()
+    memory_total = InfluxField()
+    region = InfluxTag()
+    name = InfluxTag()
+
+
+def make_points(count):
+    pivot = datetime(2017, 12, 12, 8, 57, 22)
+    return [ServerMeasurement(cpu_percent=i % 100 + 0.5,
+                              memory_free=128,
+                              memory_used=200 + i,
+                              memory_total=512,
+                              region='us-east-1',
+                              name='i-{}'.format(i % 50),
+                              time=pivot + timedelta(seconds=i)) for i in range(count)]
+
+
+def dict_path(points):
+    return make_lines({'points': [point.get_point() for point in points]}).encode('utf-8')
+
+
+def line_protocol_path(points):
+    return ServerMeasurement._encoder.encode_many(points)
+
+
+def main(count=10000, repeat=5):
+    points = make_points(count)
+    for name, func in [('dict points + make_lines', dict_path), ('compiled encoder', line_protocol_path)]:
+        best = min(timeit.repeat(lambda: func(points), number=1, repeat=repeat))
+        print('{name:<28} {usec:8.2f} us/point'.format(name=name, usec=best / count * 1e6))
+
+
+if __name__ == '__main__':
+    main()
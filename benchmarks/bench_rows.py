@@ -0,0 +1,53 @@
+"""
+Compares the memory and the time needed to materialize query results as dicts, tuples and namedtuples.
+
+    python -m benchmarks.bench_rows
+"""
+import timeit
+import tracemalloc
+
+from influxpy.queryset import InfluxQuerySet
+
+
+def make_raw(count):
+    return {'statement_id': 0, 'series': [{
+        'name': 'server',
+        'tags': {'name': 'i-1'},
+        'columns': ['time', 'cpu_percent', 'memory_free', 'memory_used', 'memory_total'],
+        'values': [['2017-12-12T08:{:02d}:{:02d}Z'.format(i // 60 % 60, i % 60), i * 0.5, 128, 200 + i, 512]
+                   for i in range(count)]
+    }]}
+
+
+def dicts(raw):
+    return list(InfluxQuerySet._series_from_raw(raw))
+
+
+def tuples(raw):
+    return list(InfluxQuerySet._rows_from_raw(raw))
+
+
+def namedtuples(raw):
+    return list(InfluxQuerySet._rows_from_raw(raw, named=True))
+
+
+def measure_memory(func, raw):
+    tracemalloc.start()
+    result = func(raw)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def main(count=100000, repeat=5):
+    raw = make_raw(count)
+    for name, func in [('dict points', dicts), ('tuples', tuples), ('namedtuples', namedtuples)]:
+        best = min(timeit.repeat(lambda: func(raw), number=1, repeat=repeat))
+        memory = measure_memory(func, raw)
+        print('{name:<12} {usec:6.3f} us/point {bytes:6.1f} bytes/point'.format(
+            name=name, usec=best / count * 1e6, bytes=memory / count))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,20 @@
+import copy
+import statistics
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
 class BaseAggregate(object):
     """Base class for aggregates"""
+    # function computing the aggregate from values already downsampled with it, None when it is not possible.
+    rollup_func = None
+    # False when rollup_func only approximates the aggregate, see InfluxQuerySet.use_downsampled.
+    rollup_exact = True
+    # selectors return one of the values, influxdb accepts fields and tags next to a single one.
+    selector = False
 
     def __init__(self):
         self.name = None
@@ -21,18 +36,92 @@ class BaseAggregate(object):
     def __eq__(self, other):
         return self.as_iql() == other.as_iql()
 
+    def __hash__(self):
+        return hash(self.as_iql())
+
+    def rollup(self) -> 'BaseAggregate':
+        """
+        Returns the aggregate reading a measurement downsampled with this aggregate, which stores
+        the downsampled values under the same field name, None when it cannot.
+        """
+        if self.rollup_func is None:
+            return None
+        rolled_up = copy.copy(self)
+        rolled_up.func = self.rollup_func
+        return rolled_up
+
+    def fields(self) -> list:
+        """The fields the aggregate reads, checked by the compiler."""
+        return []
+
+    @property
+    def column(self) -> str:
+        """The column influxdb returns the aggregate in."""
+        return self.name
+
+    def evaluate(self, values):
+        """
+        Computes the aggregate of already fetched values, see influxpy.local.
+        :param values: the values of a time bucket, a numpy array when numpy is installed
+        :return: the aggregated value, None when there is no value
+        """
+        raise RuntimeError('{} cannot be evaluated locally.'.format(self.as_iql()))
+
 
 class Aggregate(BaseAggregate):
     func = None
 
+    # value of a bucket holding only nulls.
+    empty = None
+
     def __init__(self, measurement):
         super().__init__()
         self.measurement = measurement
 
+    def arguments(self) -> list:
+        measurement = self.measurement
+        if isinstance(measurement, BaseAggregate):
+            measurement = measurement.as_iql_part()
+        return [measurement]
+
     def as_iql_part(self):
-        return '{func}({measurement})'.format(
+        return '{func}({arguments})'.format(
             func=self.func,
-            measurement=self.measurement)
+            arguments=', '.join(self.arguments()))
+
+    def fields(self) -> list:
+        if isinstance(self.measurement, BaseAggregate):
+            return self.measurement.fields()
+        return [self.measurement]
+
+    @property
+    def column(self) -> str:
+        return self.name or self.func
+
+    def evaluate(self, values):
+        # like influxdb, nulls are ignored.
+        if numpy is not None:
+            values = numpy.asarray(values)
+            if values.dtype.kind == 'O':
+                values = numpy.array([value for value in values if value is not None])
+            elif values.dtype.kind == 'f':
+                values = values[~numpy.isnan(values)]
+            if not len(values):
+                return self.empty
+            result = self.evaluate_numpy(values)
+            return result.item() if hasattr(result, 'item') else result
+
+        # NaN, used for nulls in float columns, is the only value not equal to itself.
+        values = [value for value in values if value is not None and value == value]
+        if not values:
+            return self.empty
+        return self.evaluate_python(values)
+
+    def evaluate_numpy(self, values):
+        raise RuntimeError('{} cannot be evaluated locally.'.format(self.as_iql()))
+
+    def evaluate_python(self, values: list):
+        raise RuntimeError('{} cannot be evaluated locally.'.format(self.as_iql()))
 
 
 class Raw(BaseAggregate):
@@ -46,7 +135,255 @@ class Raw(BaseAggregate):
 
 class Sum(Aggregate):
     func = 'sum'
+    rollup_func = 'sum'
+
+    def evaluate_numpy(self, values):
+        return values.sum()
+
+    def evaluate_python(self, values: list):
+        return sum(values)
 
 
 class Mean(Aggregate):
     func = 'mean'
+    # a mean of means weights every bucket equally, whatever its number of points.
+    rollup_func = 'mean'
+    rollup_exact = False
+
+    def evaluate_numpy(self, values):
+        return values.mean()
+
+    def evaluate_python(self, values: list):
+        return sum(values) / len(values)
+
+
+class Count(Aggregate):
+    func = 'count'
+    rollup_func = 'sum'
+    empty = 0
+
+    def evaluate_numpy(self, values):
+        return len(values)
+
+    def evaluate_python(self, values: list):
+        return len(values)
+
+
+class Min(Aggregate):
+    func = 'min'
+    rollup_func = 'min'
+    selector = True
+
+    def evaluate_numpy(self, values):
+        return values.min()
+
+    def evaluate_python(self, values: list):
+        return min(values)
+
+
+class Max(Aggregate):
+    func = 'max'
+    rollup_func = 'max'
+    selector = True
+
+    def evaluate_numpy(self, values):
+        return values.max()
+
+    def evaluate_python(self, values: list):
+        return max(values)
+
+
+class Median(Aggregate):
+    func = 'median'
+
+    def evaluate_numpy(self, values):
+        return numpy.median(values)
+
+    def evaluate_python(self, values: list):
+        return statistics.median(values)
+
+
+class Percentile(Aggregate):
+    """The nearest-rank percentile, as computed by influxdb."""
+    func = 'percentile'
+    selector = True
+
+    def __init__(self, measurement, percentile: float):
+        super().__init__(measurement)
+        if not 0 <= percentile <= 100:
+            raise ValueError('Percentiles must be between 0 and 100.')
+        self.percentile = percentile
+
+    def arguments(self) -> list:
+        return super().arguments() + [str(self.percentile)]
+
+    def rank(self, size: int) -> int:
+        index = int(size * self.percentile / 100 + 0.5) - 1
+        return index if 0 <= index < size else None
+
+    def evaluate_numpy(self, values):
+        index = self.rank(len(values))
+        return None if index is None else numpy.partition(values, index)[index]
+
+    def evaluate_python(self, values: list):
+        index = self.rank(len(values))
+        return None if index is None else sorted(values)[index]
+
+
+class Spread(Aggregate):
+    func = 'spread'
+
+    def evaluate_numpy(self, values):
+        return values.max() - values.min()
+
+    def evaluate_python(self, values: list):
+        return max(values) - min(values)
+
+
+class Stddev(Aggregate):
+    """The sample standard deviation, null for a single value."""
+    func = 'stddev'
+
+    def evaluate_numpy(self, values):
+        return values.std(ddof=1) if len(values) > 1 else None
+
+    def evaluate_python(self, values: list):
+        return statistics.stdev(values) if len(values) > 1 else None
+
+
+class First(Aggregate):
+    func = 'first'
+    rollup_func = 'first'
+    selector = True
+
+    def evaluate_numpy(self, values):
+        return values[0]
+
+    def evaluate_python(self, values: list):
+        return values[0]
+
+
+class Last(Aggregate):
+    func = 'last'
+    rollup_func = 'last'
+    selector = True
+
+    def evaluate_numpy(self, values):
+        return values[-1]
+
+    def evaluate_python(self, values: list):
+        return values[-1]
+
+
+class Transformation(Aggregate):
+    """
+    Base class for functions of consecutive values, e.g. Derivative(Mean('cpu')) over GROUP BY time
+    buckets. They are computed locally with transform() instead of evaluate(), values without result
+    (the first ones, nulls) giving None.
+    """
+
+    def evaluate(self, values):
+        raise RuntimeError('{} transforms a series, see transform().'.format(self.as_iql()))
+
+    def transform(self, times, values, precision: int = 1) -> list:
+        """
+        :param times: the timestamps of values, as integers
+        :param values: the values in time order
+        :param precision: nanoseconds per time unit
+        :return: the transformed values, one per value
+        """
+        if numpy is not None:
+            times = numpy.asarray(times, dtype='int64') * precision
+            values = numpy.array([numpy.nan if value is None else value for value in values], dtype='float64')
+            result = self.transform_numpy(times, values)
+            return [None if numpy.isnan(value) else value for value in result.tolist()]
+
+        times = [time * precision for time in times]
+        values = [None if value is None or value != value else value for value in values]
+        return self.transform_python(times, values)
+
+    def transform_numpy(self, times, values):
+        raise RuntimeError('{} cannot be evaluated locally.'.format(self.as_iql()))
+
+    def transform_python(self, times: list, values: list) -> list:
+        raise RuntimeError('{} cannot be evaluated locally.'.format(self.as_iql()))
+
+
+class Derivative(Transformation):
+    """The rate of change per unit (one second by default) between consecutive values."""
+    func = 'derivative'
+
+    def __init__(self, measurement, unit=None):
+        super().__init__(measurement)
+        self.unit = unit
+
+    def arguments(self) -> list:
+        arguments = super().arguments()
+        if self.unit is not None:
+            arguments.append(self.unit.as_iql())
+        return arguments
+
+    @property
+    def unit_nanoseconds(self) -> int:
+        return 1000000000 * (1 if self.unit is None else self.unit.total_seconds())
+
+    def transform_numpy(self, times, values):
+        if len(values) < 2:
+            return numpy.full(len(values), numpy.nan)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            rates = numpy.diff(values) * self.unit_nanoseconds / numpy.diff(times)
+        return numpy.concatenate([[numpy.nan], rates])
+
+    def transform_python(self, times: list, values: list) -> list:
+        rates = [None] * min(len(values), 1)
+        for index in range(1, len(values)):
+            if values[index] is None or values[index - 1] is None or times[index] == times[index - 1]:
+                rates.append(None)
+            else:
+                rates.append((values[index] - values[index - 1]) * self.unit_nanoseconds
+                             / (times[index] - times[index - 1]))
+        return rates
+
+
+class NonNegativeDerivative(Derivative):
+    """A derivative whose negative rates, e.g. counter resets, are null."""
+    func = 'non_negative_derivative'
+
+    def transform_numpy(self, times, values):
+        rates = super().transform_numpy(times, values)
+        rates[rates < 0] = numpy.nan
+        return rates
+
+    def transform_python(self, times: list, values: list) -> list:
+        return [None if rate is not None and rate < 0 else rate for rate in super().transform_python(times, values)]
+
+
+class MovingAverage(Transformation):
+    """The mean of the window last values."""
+    func = 'moving_average'
+
+    def __init__(self, measurement, window: int):
+        super().__init__(measurement)
+        if window < 1:
+            raise ValueError('The window of a moving average must be a positive integer.')
+        self.window = window
+
+    def arguments(self) -> list:
+        return super().arguments() + [str(self.window)]
+
+    def transform_numpy(self, times, values):
+        # convolve() swaps its arguments when values is the shorter one.
+        if len(values) < self.window:
+            return numpy.full(len(values), numpy.nan)
+        averages = numpy.convolve(values, numpy.ones(self.window), mode='valid') / self.window
+        return numpy.concatenate([numpy.full(self.window - 1, numpy.nan), averages])
+
+    def transform_python(self, times: list, values: list) -> list:
+        averages = []
+        for index in range(len(values)):
+            window = values[max(index - self.window + 1, 0):index + 1]
+            if len(window) < self.window or None in window:
+                averages.append(None)
+            else:
+                averages.append(sum(window) / self.window)
+        return averages
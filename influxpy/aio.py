@@ -0,0 +1,187 @@
+import asyncio
+import base64
+import logging
+import weakref
+from typing import List
+
+from influxdb.exceptions import InfluxDBClientError, InfluxDBServerError
+
+from influxpy.client import DEFAULT_ALIAS, InfluxConnection, client_wrapper
+from influxpy.decoders import CONTENT_TYPES, JSON, get_decoder
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+logger = logging.getLogger('influxpy.aio')
+
+
+async def _close_on_shutdown(sessions: dict):
+    """
+    Left suspended once started, closes sessions when the event loop finalizes its async generators,
+    which asyncio.run() does before closing the loop.
+    """
+    try:
+        yield
+    finally:
+        for session in list(sessions.values()):
+            await session.close()
+
+
+class AsyncInfluxClientWrapper(object):
+    """
+    asyncio counterpart of InfluxClientWrapper backed by pooled aiohttp sessions, one per host.
+
+    The default database is the one of url, or the one of client_wrapper when url is None, other
+    aliases are the connections of client_wrapper. Requests fail over between the hosts of a
+    connection like InfluxConnection.call does.
+
+    Sessions are created lazily in the running event loop and closed with it, or by close(),
+    pool_size bounds the number of concurrent connections to each host.
+    """
+
+    def __init__(self, url: str = None, pool_size: int = 100, timeout: float = None):
+        self.url = url
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._connection = None
+        # event loop -> (sessions by host, their closer)
+        self._sessions = weakref.WeakKeyDictionary()
+
+    def get_connection(self, using: str = None) -> InfluxConnection:
+        if self.url is not None and (using is None or using == DEFAULT_ALIAS):
+            if self._connection is None:
+                self._connection = InfluxConnection.from_url(self.url)
+            return self._connection
+        return client_wrapper.get_connection(using)
+
+    def get_database(self, using: str = None) -> str:
+        if self.url is None or (using is not None and using != DEFAULT_ALIAS):
+            # follows the sync wrapper so setup_test_database applies to both.
+            return client_wrapper.get_database(using)
+        return self.get_connection().database
+
+    @property
+    def database(self):
+        return self.get_database()
+
+    async def get_session(self, connection: InfluxConnection, host: tuple) -> 'aiohttp.ClientSession':
+        if aiohttp is None:
+            raise RuntimeError('aiohttp is required for asyncio support, install influxpy[async].')
+
+        loop = asyncio.get_running_loop()
+        if loop not in self._sessions:
+            sessions = {}
+            closer = _close_on_shutdown(sessions)
+            await closer.asend(None)
+            # the closer is referenced here, it would close the sessions when collected.
+            self._sessions[loop] = (sessions, closer)
+        sessions, _ = self._sessions[loop]
+
+        key = (host, connection.ssl, connection.username, connection.password)
+        session = sessions.get(key)
+        if session is None or session.closed:
+            headers = {}
+            if connection.username is not None:
+                credentials = '{}:{}'.format(connection.username, connection.password or '').encode('utf-8')
+                headers['Authorization'] = 'Basic ' + base64.b64encode(credentials).decode('ascii')
+            session = sessions[key] = aiohttp.ClientSession(
+                base_url='{scheme}://{host}:{port}'.format(scheme='https' if connection.ssl else 'http',
+                                                           host=host[0],
+                                                           port=host[1]),
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                headers=headers,
+                timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return session
+
+    async def close(self):
+        """Closes the sessions of the running event loop."""
+        entry = self._sessions.pop(asyncio.get_running_loop(), None)
+        if entry is not None:
+            await entry[1].aclose()
+
+    @staticmethod
+    async def _check_response(response, expected_response_code):
+        if 500 <= response.status < 600:
+            raise InfluxDBServerError(await response.read())
+        if response.status != expected_response_code:
+            raise InfluxDBClientError(await response.read(), response.status)
+
+    async def request(self, method: str, path: str, expected_response_code: int, using: str = None, **kwargs):
+        """
+        Sends a request to the hosts of the using connection in turn until one answers.
+        :return: the response body and content type
+        """
+        connection = self.get_connection(using)
+        error = None
+        for host in connection.available_hosts():
+            session = await self.get_session(connection, host)
+            try:
+                async with session.request(method, path, **kwargs) as response:
+                    await self._check_response(response, expected_response_code)
+                    body = await response.read()
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                logger.warning('{host}:{port} is unavailable: {error}'.format(host=host[0], port=host[1], error=e))
+                connection.mark_down(host)
+                error = e
+            else:
+                connection.mark_up(host)
+                return body, response.headers.get('Content-Type')
+        raise error
+
+    async def query_raw(self,
+                        query: str,
+                        epoch: str = None,
+                        using: str = None,
+                        response_format: str = None) -> List[dict]:
+        """
+        Sends a query, see InfluxClientWrapper.query_raw
+        :return: the raw result of each statement, as ResultSet.raw
+        """
+        params = {'q': query}
+        database = self.get_database(using)
+        if database:
+            params['db'] = database
+        if epoch is not None:
+            params['epoch'] = epoch
+        headers = {'Accept': CONTENT_TYPES[response_format or JSON]}
+
+        body, content_type = await self.request('GET', '/query', 200, using=using, params=params, headers=headers)
+        document = get_decoder(content_type)(body, epoch)
+        if 'error' in document:
+            raise InfluxDBClientError(document['error'])
+
+        results = document.get('results', [])
+        for result in results:
+            if 'error' in result:
+                raise InfluxDBClientError(result['error'])
+        return results
+
+    async def query(self, query: str, using: str = None) -> dict:
+        """
+        Sends a query.
+        :param query: the iql query
+        :param using: the database alias
+        :return: the raw result of the first statement, as ResultSet.raw
+        """
+        results = await self.query_raw(query, using=using)
+        return results[0] if results else {}
+
+    async def write_lines(self, body: bytes, precision: str = 'n', using: str = None):
+        """
+        Sends an already encoded line protocol body.
+        :param body: the line protocol body
+        :param precision: the precision of the timestamps in body
+        :param using: the database alias
+        """
+        params = {'precision': precision}
+        database = self.get_database(using)
+        if database:
+            params['db'] = database
+        headers = {'Content-Type': 'application/octet-stream'}
+
+        await self.request('POST', '/write', 204, using=using, params=params, data=body, headers=headers)
+
+
+async_client_wrapper = AsyncInfluxClientWrapper()
@@ -0,0 +1,117 @@
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
+
+import requests
+from influxdb.exceptions import InfluxDBClientError, InfluxDBServerError
+
+from influxpy.client import client_wrapper
+from influxpy.fields import BaseDuration, Days
+from influxpy.queryset import InfluxQuerySet
+
+logger = logging.getLogger('influxpy.backfill')
+
+ChunkReport = namedtuple('ChunkReport', ['index', 'query', 'duration', 'error'])
+BackfillProgress = namedtuple('BackfillProgress', ['done', 'skipped', 'failed', 'total', 'report'])
+
+
+class Checkpoint(object):
+    """
+    JSON file recording the chunks of a backfill already written, so an interrupted backfill
+    only runs the remaining ones.
+    """
+
+    def __init__(self, path: str, query: str):
+        self.path = path
+        self.query = query
+        self.done = set()
+        self._lock = threading.Lock()
+
+        if os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            if state['query'] != query:
+                raise RuntimeError('The checkpoint {} was written by another backfill.'.format(path))
+            self.done = set(state['done'])
+
+    def add(self, chunk: str):
+        with self._lock:
+            self.done.add(chunk)
+            # replaced atomically, a crash never leaves a truncated checkpoint.
+            with open(self.path + '.tmp', 'w') as f:
+                json.dump({'query': self.query, 'done': sorted(self.done)}, f)
+            os.replace(self.path + '.tmp', self.path)
+
+
+def backfill(source,
+             start: datetime.datetime,
+             end: datetime.datetime,
+             chunk: BaseDuration = Days(1),
+             max_workers: int = 2,
+             checkpoint: str = None,
+             progress: Callable[[BackfillProgress], None] = None,
+             using: str = None) -> List[ChunkReport]:
+    """
+    Runs the SELECT ... INTO of a continuous query over history, one time chunk per query.
+
+    Chunks are aligned on the resolution of the query and run max_workers at a time. Failed chunks
+    are reported and left out of the checkpoint, running the backfill again with the same checkpoint
+    retries them only.
+    :param source: a ContinuousQuery or a query set with into()
+    :param start: the beginning of the backfilled range
+    :param end: the end of the backfilled range, excluded
+    :param chunk: the time range of each query
+    :param max_workers: the number of queries running at once
+    :param checkpoint: path of the checkpoint file, see Checkpoint
+    :param progress: called with a BackfillProgress after each chunk
+    :param using: the database alias, defaults to the one of the query set
+    :return: the reports of the chunks which ran
+    """
+    queryset = getattr(source, 'queryset', source)  # type: InfluxQuerySet
+    if queryset.query.destination is None:
+        raise RuntimeError('A backfill needs a query set with into().')
+    if using is not None:
+        queryset = queryset.using(using)
+
+    queryset = queryset.filter(time__gte=start, time__lt=end)
+    chunks = [chunk_queryset.iql_query() for chunk_queryset in queryset.split_time(chunk=chunk)._split_querysets()]
+    alias = queryset.query.database
+
+    state = Checkpoint(checkpoint, queryset.iql_query()) if checkpoint else None
+    pending = [(index, query) for index, query in enumerate(chunks) if state is None or query not in state.done]
+
+    counts = {'done': 0, 'failed': 0}
+    lock = threading.Lock()
+
+    def run(item) -> ChunkReport:
+        index, query = item
+        started = time.perf_counter()
+        error = None
+        try:
+            client_wrapper.query(query, using=alias)
+        except (InfluxDBClientError, InfluxDBServerError, requests.exceptions.RequestException) as e:
+            logger.error('Backfill chunk {index} failed: {error}'.format(index=index, error=e))
+            error = e
+        report = ChunkReport(index=index, query=query, duration=time.perf_counter() - started, error=error)
+
+        if error is None and state is not None:
+            state.add(query)
+        with lock:
+            counts['failed' if error else 'done'] += 1
+            current = BackfillProgress(done=counts['done'],
+                                       skipped=len(chunks) - len(pending),
+                                       failed=counts['failed'],
+                                       total=len(chunks),
+                                       report=report)
+            if progress is not None:
+                progress(current)
+        return report
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(run, pending))
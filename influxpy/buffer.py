@@ -0,0 +1,236 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import namedtuple
+from typing import Callable
+
+from influxpy.line_protocol import join_lines
+
+logger = logging.getLogger('influxpy.buffer')
+
+BufferMetrics = namedtuple('BufferMetrics', [
+    'queue_depth',
+    'written_points',
+    'dropped_points',
+    'flushes',
+    'failed_flushes',
+    'last_flush_latency',
+    'max_flush_latency',
+])
+
+
+class _FlushRequest(object):
+    def __init__(self):
+        self.done = threading.Event()
+
+
+_STOP = object()
+
+
+class BufferedWriter(object):
+    """
+    Queues line protocol lines and writes them from a background thread.
+
+    The queue is flushed when batch_size lines are waiting or when the oldest line has waited
+    max_latency seconds. When the queue is full, put() waits up to put_timeout seconds
+    (forever when None, not at all when block is False) before dropping the line.
+    """
+
+    def __init__(self,
+                 write: Callable[[bytes], object],
+                 batch_size: int = 5000,
+                 max_latency: float = 1.0,
+                 max_queue_size: int = 100000,
+                 block: bool = True,
+                 put_timeout: float = None):
+        if batch_size < 1:
+            raise ValueError('batch_size must be a positive integer.')
+
+        self._options = dict(batch_size=batch_size,
+                             max_latency=max_latency,
+                             max_queue_size=max_queue_size,
+                             block=block,
+                             put_timeout=put_timeout)
+        self.write = write
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.block = block
+        self.put_timeout = put_timeout
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        self._written_points = 0
+        self._dropped_points = 0
+        self._flushes = 0
+        self._failed_flushes = 0
+        self._last_flush_latency = 0.0
+        self._max_flush_latency = 0.0
+        # guards _closed and _enqueuing, the number of put() and flush() calls enqueuing an item.
+        self._state = threading.Condition()
+        self._closed = False
+        self._enqueuing = 0
+
+        # started by the first put(), never from a fork handler.
+        self._thread = None
+        atexit.register(self.close)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='influxpy-buffered-writer', daemon=True)
+                self._thread.start()
+
+    def clone(self) -> 'BufferedWriter':
+        """Returns a new writer with the same settings, used to restart buffering in a forked process."""
+        atexit.unregister(self.close)
+        return BufferedWriter(self.write, **self._options)
+
+    def _enqueue(self, item, timeout: float = None) -> bool:
+        """
+        Queues item unless the writer is closed, close() waits for it so _STOP is always queued last.
+        :return: False when the queue stayed full
+        """
+        with self._state:
+            if self._closed:
+                raise RuntimeError('The buffered writer is closed.')
+            self._enqueuing += 1
+        try:
+            if self._thread is None:
+                self._start()
+            self._queue.put(item, block=timeout is None or timeout > 0, timeout=timeout)
+            return True
+        except queue.Full:
+            return False
+        finally:
+            with self._state:
+                self._enqueuing -= 1
+                self._state.notify_all()
+
+    def put(self, line: str) -> bool:
+        """
+        Queues a line for writing.
+        :param line: a line protocol line without the trailing newline
+        :return: False when the line was dropped
+        """
+        if not self._enqueue(line, timeout=self.put_timeout if self.block else 0):
+            with self._lock:
+                self._dropped_points += 1
+            return False
+        return True
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Waits until every line queued before the call has been written.
+        :return: False if timeout expired before the flush happened or the writer is closed
+        """
+        if self._thread is None and not self._closed:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        request = _FlushRequest()
+        try:
+            if not self._enqueue(request, timeout=timeout):
+                return False
+        except RuntimeError:
+            return False
+        return request.done.wait(None if deadline is None else max(deadline - time.monotonic(), 0))
+
+    def close(self, timeout: float = None):
+        """Flushes the queue and stops the background thread."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        def remaining():
+            return None if deadline is None else max(deadline - time.monotonic(), 0)
+
+        with self._state:
+            if self._closed:
+                return
+            self._closed = True
+            # lines being queued by other threads are written before stopping.
+            self._state.wait_for(lambda: not self._enqueuing, remaining())
+        atexit.unregister(self.close)
+
+        if self._thread is not None:
+            try:
+                self._queue.put(_STOP, timeout=remaining())
+            except queue.Full:
+                logger.warning('The buffered writer did not stop, its queue is still full.')
+                return
+            self._thread.join(remaining())
+
+    @property
+    def metrics(self) -> BufferMetrics:
+        with self._lock:
+            return BufferMetrics(queue_depth=self._queue.qsize(),
+                                 written_points=self._written_points,
+                                 dropped_points=self._dropped_points,
+                                 flushes=self._flushes,
+                                 failed_flushes=self._failed_flushes,
+                                 last_flush_latency=self._last_flush_latency,
+                                 max_flush_latency=self._max_flush_latency)
+
+    def _write_batch(self, batch):
+        started = time.perf_counter()
+        failed = False
+        try:
+            self.write(join_lines(batch))
+        except Exception as e:
+            # the writer thread must survive any error, the points are lost though.
+            logger.error('Buffered write of {size} points failed: {error}'.format(size=len(batch), error=e))
+            failed = True
+        latency = time.perf_counter() - started
+
+        with self._lock:
+            self._flushes += 1
+            self._last_flush_latency = latency
+            self._max_flush_latency = max(self._max_flush_latency, latency)
+            if failed:
+                self._failed_flushes += 1
+                self._dropped_points += len(batch)
+            else:
+                self._written_points += len(batch)
+
+    def _run(self):
+        batch = []
+        deadline = None
+
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, str):
+                if not batch:
+                    deadline = time.monotonic() + self.max_latency
+                batch.append(item)
+                if len(batch) < self.batch_size:
+                    continue
+
+            if batch:
+                self._write_batch(batch)
+                batch = []
+            deadline = None
+
+            if isinstance(item, _FlushRequest):
+                item.done.set()
+            elif item is _STOP:
+                self._drain()
+                return
+
+    def _drain(self):
+        """Writes anything still queued behind _STOP, so no accepted line is dropped silently."""
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, str):
+                batch.append(item)
+            elif isinstance(item, _FlushRequest):
+                item.done.set()
+        for start in range(0, len(batch), self.batch_size):
+            self._write_batch(batch[start:start + self.batch_size])
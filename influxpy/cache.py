@@ -0,0 +1,115 @@
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from influxpy.fields import InfluxTimeField
+
+CacheEntry = namedtuple('CacheEntry', ['series', 'fetched_at', 'refresh_from'])
+
+CacheStats = namedtuple('CacheStats', ['hits', 'partial_hits', 'misses', 'maxsize', 'currsize'])
+
+FINAL = -1
+
+
+class QueryResultCache(object):
+    """
+    Size bounded LRU cache of query results, keyed on the database and the compiled query.
+
+    An entry refresh_from is the epoch (in seconds) from which it must be refetched once its
+    ttl expired, None when the whole query must be refetched and FINAL when every time bucket
+    of the query is closed so the entry never expires.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 10.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+
+    def get(self, key) -> CacheEntry:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry: CacheEntry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def is_fresh(self, entry: CacheEntry, ttl: float) -> bool:
+        return entry.refresh_from == FINAL or time.time() - entry.fetched_at < ttl
+
+    def _after_fork(self):
+        # another thread of the parent may have held the lock when forking.
+        self._lock = threading.Lock()
+
+    def record(self, hit: bool = False, partial: bool = False):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            elif partial:
+                self.partial_hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(hits=self.hits,
+                              partial_hits=self.partial_hits,
+                              misses=self.misses,
+                              maxsize=self.max_entries,
+                              currsize=len(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.partial_hits = self.misses = 0
+
+
+result_cache = QueryResultCache()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=result_cache._after_fork)
+
+
+def copy_series(series: list) -> list:
+    """
+    Returns series whose points lists can be changed without changing the cached ones.
+    """
+    return [serie._replace(points=list(serie.points)) for serie in series]
+
+
+def merge_refreshed(cached: list, fresh: list, refresh_from: int) -> list:
+    """
+    Replaces the points of cached series at or after refresh_from with the fresh ones,
+    series being matched by their tags.
+    :param cached: the cached series
+    :param fresh: series fetched from refresh_from
+    :param refresh_from: epoch in seconds
+    """
+    def series_key(serie):
+        return tuple(sorted((serie.tags or {}).items()))
+
+    def is_closed(point):
+        epoch = InfluxTimeField.epoch_value(InfluxTimeField.python_value(point['time']))
+        return epoch // 1000000000 < refresh_from
+
+    fresh_by_key = OrderedDict((series_key(serie), serie) for serie in fresh)
+    merged = []
+    for serie in cached:
+        points = [point for point in serie.points if is_closed(point)]
+        refreshed = fresh_by_key.pop(series_key(serie), None)
+        if refreshed is not None:
+            points.extend(refreshed.points)
+        merged.append(serie._replace(points=points))
+
+    merged.extend(fresh_by_key.values())
+    return merged
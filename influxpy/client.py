@@ -1,14 +1,252 @@
+import gzip
+import itertools
 import os
+import threading
+import time
+import weakref
 
 import logging
+from collections import namedtuple
+from typing import Callable, Dict, List, Tuple
+from urllib.parse import urlparse, parse_qsl
+
+import requests
 from influxdb import InfluxDBClient
-import os
+from influxdb.exceptions import InfluxDBClientError
+from influxdb.line_protocol import make_lines
 import binascii
 
 from influxdb.resultset import ResultSet
 
+from influxpy.buffer import BufferedWriter
+from influxpy.decoders import CONTENT_TYPES, JSON, MSGPACK, decode_json, format_times, get_decoder
+
 logger = logging.getLogger('influxpy.client')
 
+# every connection, so forked children can replace their locks.
+_connections = weakref.WeakSet()
+
+
+def _parse_bool(value: str) -> bool:
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+
+CONNECTION_OPTIONS = {
+    'pool_size': int,
+    'timeout': float,
+    'retries': int,
+    'ssl': _parse_bool,
+    'verify_ssl': _parse_bool,
+    'keep_alive': _parse_bool,
+    'failover_timeout': float,
+    'gzip': _parse_bool,
+    'gzip_level': int,
+    'gzip_min_size': int,
+}
+
+
+class TransferStats(namedtuple('TransferStats', ['raw_bytes', 'wire_bytes'])):
+    """Size of http bodies before (raw) and after (wire) gzip compression."""
+    __slots__ = ()
+
+    @property
+    def saved_bytes(self) -> int:
+        return self.raw_bytes - self.wire_bytes
+
+
+def parse_database_url(database_url: str) -> dict:
+    """
+    Parses an influxdb://{username}:{password}@{host}:{port}[,{host}:{port}...]/{database}[?{option}={value}] url.
+
+    Options are InfluxConnection parameters, e.g. ?pool_size=20&timeout=5&retries=1&ssl=true&gzip=true
+    :param database_url: the url to parse
+    :return: the InfluxConnection parameters
+    """
+    parse_result = urlparse(database_url)
+
+    if parse_result.scheme != 'influxdb':
+        raise ValueError('The url scheme should be influxdb.')
+
+    _, _, hosts = parse_result.netloc.rpartition('@')
+
+    params = dict()
+    params['username'] = parse_result.username
+    params['password'] = parse_result.password
+    params['hosts'] = []
+    for host in hosts.split(','):
+        hostname, _, port = host.rpartition(':') if ':' in host else (host, None, None)
+        params['hosts'].append((hostname, int(port) if port else 8086))
+    params['database'] = parse_result.path.replace('/', '')
+
+    for key, value in parse_qsl(parse_result.query):
+        if key not in CONNECTION_OPTIONS:
+            raise ValueError('Unknown connection option "{}".'.format(key))
+        params[key] = CONNECTION_OPTIONS[key](value)
+
+    return params
+
+
+class InfluxConnection(object):
+    """
+    A database served by one or several influxdb hosts.
+
+    Requests are spread over the hosts in a round-robin fashion, a host failing to answer
+    is skipped for failover_timeout seconds and the request is retried on the next one.
+    Each host gets its own InfluxDBClient, thus its own pool of pool_size kept-alive connections.
+
+    Clients (and their http sessions) are created per thread and per process, so threads never
+    share a session and a forked child never reuses the sockets of its parent.
+
+    With gzip, written bodies of at least gzip_min_size bytes are compressed at gzip_level and
+    responses are asked gzip encoded. The bytes sent and received are totalled in transfers.
+    """
+
+    def __init__(self,
+                 hosts=(('localhost', 8086),),
+                 username='root',
+                 password='root',
+                 database=None,
+                 ssl=False,
+                 verify_ssl=False,
+                 timeout=None,
+                 retries=3,
+                 pool_size=10,
+                 keep_alive=True,
+                 failover_timeout=30.0,
+                 gzip=False,
+                 gzip_level=6,
+                 gzip_min_size=1024):
+        if not hosts:
+            raise ValueError('A connection needs at least one host.')
+        if not 0 <= gzip_level <= 9:
+            raise ValueError('gzip_level must be between 0 and 9.')
+
+        self.hosts = [tuple(host) for host in hosts]
+        self.username = username
+        self.password = password
+        self.database = database
+        self.ssl = ssl
+        self.verify_ssl = verify_ssl
+        self.timeout = timeout
+        self.retries = retries
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.failover_timeout = failover_timeout
+        self.gzip = gzip
+        self.gzip_level = gzip_level
+        self.gzip_min_size = gzip_min_size
+
+        self._local = threading.local()
+        self._next_host = itertools.count()
+        self._down_until = {}
+        self._transfers = {'sent': TransferStats(0, 0), 'received': TransferStats(0, 0)}
+        self._transfers_lock = threading.Lock()
+        _connections.add(self)
+
+    def _after_fork(self):
+        # another thread of the parent may have held the lock when forking.
+        self._transfers_lock = threading.Lock()
+
+    @classmethod
+    def from_url(cls, database_url: str, **options) -> 'InfluxConnection':
+        params = parse_database_url(database_url)
+        params.update(options)
+        return cls(**params)
+
+    def create_session(self) -> requests.Session:
+        """Returns the http session of a client, InfluxDBClient mounts its pool_size adapter on it."""
+        session = requests.Session()
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
+
+    def create_client(self, host: str, port: int) -> InfluxDBClient:
+        return InfluxDBClient(host=host,
+                              port=port,
+                              username=self.username,
+                              password=self.password,
+                              database=self.database,
+                              ssl=self.ssl,
+                              verify_ssl=self.verify_ssl,
+                              timeout=self.timeout,
+                              retries=self.retries,
+                              pool_size=self.pool_size,
+                              session=self.create_session())
+
+    def compress(self, body: bytes) -> Tuple[bytes, dict]:
+        """
+        Gzips a request body when gzip is enabled and the body is large enough to be worth it.
+        :return: the body to send and the headers describing its encoding
+        """
+        if not self.gzip or len(body) < self.gzip_min_size:
+            return body, {}
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0), {'Content-Encoding': 'gzip'}
+
+    def record(self, direction: str, stats: TransferStats):
+        """Adds stats to the 'sent' or 'received' totals."""
+        with self._transfers_lock:
+            total = self._transfers[direction]
+            self._transfers[direction] = TransferStats(raw_bytes=total.raw_bytes + stats.raw_bytes,
+                                                       wire_bytes=total.wire_bytes + stats.wire_bytes)
+
+    @property
+    def transfers(self) -> Dict[str, TransferStats]:
+        """The TransferStats of the bodies sent and received since the connection was created."""
+        with self._transfers_lock:
+            return dict(self._transfers)
+
+    def get_clients(self) -> List[InfluxDBClient]:
+        """Returns the clients of the current thread, one per host."""
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            # the clients of the parent process (if any) are dropped, not closed, their sockets belong to it.
+            self._local.clients = [self.create_client(host, port) for host, port in self.hosts]
+            self._local.pid = pid
+        return self._local.clients
+
+    def get_client(self) -> InfluxDBClient:
+        """Returns the client of the next available host."""
+        return next(self._candidates())[1]
+
+    def available_hosts(self) -> List[tuple]:
+        """Returns the hosts to try in turn, starting from the next one and skipping the ones marked down."""
+        start = next(self._next_host)
+        ordered = [self.hosts[(start + offset) % len(self.hosts)] for offset in range(len(self.hosts))]
+        now = time.monotonic()
+        available = [host for host in ordered if self._down_until.get(host, 0) <= now]
+        # when every host is down they are all tried anyway.
+        return available or ordered
+
+    def mark_down(self, host: tuple):
+        """Skips host for failover_timeout seconds."""
+        self._down_until[host] = time.monotonic() + self.failover_timeout
+
+    def mark_up(self, host: tuple):
+        self._down_until.pop(host, None)
+
+    def _candidates(self):
+        clients = dict(zip(self.hosts, self.get_clients()))
+        return iter([(host, clients[host]) for host in self.available_hosts()])
+
+    def call(self, func: Callable[[InfluxDBClient], object]):
+        """
+        Calls func with a client, failing over to the next host on connection errors.
+        :param func: the request to send, receives the client
+        :return: the func result
+        """
+        error = None
+        for host, client in self._candidates():
+            try:
+                result = func(client)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                logger.warning('{host}:{port} is unavailable: {error}'.format(host=host[0], port=host[1], error=e))
+                self.mark_down(host)
+                error = e
+            else:
+                self.mark_up(host)
+                return result
+        raise error
+
 
 class SingletonMetaClass(type):
     def __new__(cls, name, bases, dict):
@@ -24,36 +262,89 @@ class SingletonMetaClass(type):
         return super(SingletonMetaClass, cls).__new__(cls, name, bases, dict)
 
 
+DEFAULT_ALIAS = 'default'
+
+
 class InfluxClientWrapper(metaclass=SingletonMetaClass):
     def __init__(self, client=None):
         self._database = None
         self._original_database = None
+        self.connection = None  # type: InfluxConnection
+        self.connections = {}  # type: Dict[str, InfluxConnection]
         self.client = client  # type: InfluxDBClient
-        _ = self.get_client()  # ensures that client is initialized
+        self.buffer = None  # type: BufferedWriter
+        _ = self.get_connection()  # ensures that connection is initialized
 
-    # FIXME: This should be less shitty
-    def get_default_client(self) -> InfluxDBClient:
-        database_url = os.environ.get('INFLUXDB_URL', None)
-        from urllib.parse import urlparse
-        parse_result = urlparse(database_url)
+    def configure(self, database_url: str = None, **options) -> InfluxConnection:
+        """
+        Replaces the connection, database_url defaults to the INFLUXDB_URL environment variable.
+        :param database_url: the influxdb:// url, see parse_database_url
+        :param options: InfluxConnection parameters overriding the url ones
+        :return: the new connection
+        """
+        self.connection = InfluxConnection.from_url(database_url or os.environ.get('INFLUXDB_URL', None), **options)
+        self._database = self.connection.database
+        return self.connection
 
-        if parse_result.scheme != 'influxdb':
+    def get_default_connection(self) -> InfluxConnection:
+        try:
+            connection = InfluxConnection.from_url(os.environ.get('INFLUXDB_URL', None))
+        except ValueError:
             logger.error('The DATABASE_URL scheme should be influxdb, returning default influx client.')
-            return InfluxDBClient()
+            return InfluxConnection()
 
-        client_params = dict()
-        client_params['host'] = parse_result.hostname
-        client_params['username'] = parse_result.username
-        client_params['password'] = parse_result.password
-        self._database = parse_result.path.replace('/', '')
+        self._database = connection.database
 
-        return InfluxDBClient(**client_params)
+        return connection
 
-    def get_client(self) -> InfluxDBClient:
-        if self.client is None:
-            self.client = self.get_default_client()
+    def register(self, alias: str, database_url: str, **options) -> InfluxConnection:
+        """
+        Registers another database, used through InfluxQuerySet.using(alias) or save(using=alias).
+        :param alias: the name of the database for influxpy
+        :param database_url: the influxdb:// url, see parse_database_url
+        :param options: InfluxConnection parameters overriding the url ones
+        :return: the connection
+        """
+        if alias == DEFAULT_ALIAS:
+            return self.configure(database_url, **options)
+        self.connections[alias] = InfluxConnection.from_url(database_url, **options)
+        return self.connections[alias]
+
+    def get_connection(self, using: str = None) -> InfluxConnection:
+        """
+        Returns the connection registered as using, aliases which were not registered are read
+        from the INFLUXDB_URL_{ALIAS} environment variable.
+        """
+        if using is None or using == DEFAULT_ALIAS:
+            if self.connection is None:
+                self.connection = self.get_default_connection()
+            return self.connection
+
+        if using not in self.connections:
+            database_url = os.environ.get('INFLUXDB_URL_' + using.upper(), None)
+            if database_url is None:
+                raise RuntimeError('The database "{}" is not registered.'.format(using))
+            self.connections[using] = InfluxConnection.from_url(database_url)
+
+        return self.connections[using]
+
+    def get_database(self, using: str = None) -> str:
+        if using is None or using == DEFAULT_ALIAS:
+            return self.database
+        return self.get_connection(using).database
+
+    def get_client(self, using: str = None) -> InfluxDBClient:
+        if self.client is not None and (using is None or using == DEFAULT_ALIAS):
+            return self.client
 
-        return self.client
+        return self.get_connection(using).get_client()
+
+    def call(self, func: Callable[[InfluxDBClient], object], using: str = None):
+        """Calls func with a client of the using database, see InfluxConnection.call"""
+        if self.client is not None and (using is None or using == DEFAULT_ALIAS):
+            return func(self.client)
+
+        return self.get_connection(using).call(func)
 
     def setup_test_database(self):
         """Uses config to draft a new database"""
@@ -71,17 +362,148 @@ class InfluxClientWrapper(metaclass=SingletonMetaClass):
             self._database = self._original_database
             self._original_database = None
 
-    def query(self, query):
-        return self.get_client().query(query, database=self.database)
+    def query(self, query, epoch=None, using=None):
+        database = self.get_database(using)
+        return self.call(lambda client: client.query(query, database=database, epoch=epoch), using=using)
+
+    def query_raw(self,
+                  query: str,
+                  epoch: str = None,
+                  using: str = None,
+                  response_format: str = None) -> List[dict]:
+        """
+        Sends a query and decodes the response with influxpy.decoders, skipping the creation of ResultSets.
+        :param query: the iql query, which may hold several statements
+        :param epoch: the precision of the returned timestamps, RFC3339 strings when None
+        :param using: the database alias
+        :param response_format: 'json' (default), 'csv' or 'msgpack', asked through the Accept header
+        :return: the raw result of each statement, as ResultSet.raw
+        """
+        params = {'q': query, 'db': self.get_database(using)}
+        if epoch is not None:
+            params['epoch'] = epoch
+        elif response_format == MSGPACK:
+            # InfluxDBClient.request unpacks msgpack bodies itself, rounding typed timestamps to microseconds:
+            # they are asked as integers and formatted here.
+            params['epoch'] = 'ns'
+        headers = {'Accept': CONTENT_TYPES[response_format or JSON]}
+        connection = self.get_connection(using)
+        if connection.gzip:
+            headers['Accept-Encoding'] = 'gzip'
+
+        response = self.call(lambda client: client.request(url='query',
+                                                           method='GET',
+                                                           params=params,
+                                                           expected_response_code=200,
+                                                           headers=headers),
+                             using=using)
+        # the raw stream counts the bytes read from the socket, before requests decompresses them.
+        stats = TransferStats(raw_bytes=len(response.content), wire_bytes=response.raw.tell())
+        connection.record('received', stats)
+        logger.debug('Received {raw} bytes in {wire} bytes.'.format(raw=stats.raw_bytes, wire=stats.wire_bytes))
+        if response._msgpack is not None:
+            # already unpacked by InfluxDBClient.request.
+            document = response._msgpack
+        else:
+            # servers which do not support the format answer json.
+            document = get_decoder(response.headers.get('Content-Type'))(response.content, epoch)
+        if epoch is None and 'epoch' in params:
+            format_times(document)
+        if 'error' in document:
+            raise InfluxDBClientError(document['error'])
+
+        results = document.get('results', [])
+        for result in results:
+            if 'error' in result:
+                raise InfluxDBClientError(result['error'])
+        return results
+
+    def query_chunked(self, query, chunk_size=10000, using=None):
+        """
+        Sends a query asking influxdb for a chunked response and reads it as a stream.
+        :param query: the iql query
+        :param chunk_size: maximum number of points per chunk
+        :param using: the database alias
+        :return: a generator of raw results, one per chunk
+        """
+        params = {'q': query, 'db': self.get_database(using), 'chunked': 'true', 'chunk_size': chunk_size}
+
+        response = self.call(lambda client: client.request(url='query',
+                                                           method='GET',
+                                                           params=params,
+                                                           stream=True,
+                                                           expected_response_code=200,
+                                                           headers={'Accept': CONTENT_TYPES[JSON]}),
+                             using=using)
+        with response:
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                for result in decode_json(line).get('results', []):
+                    if 'error' in result:
+                        raise InfluxDBClientError(result['error'])
+                    yield result
+
+    def write_points(self, points, using=None) -> TransferStats:
+        """
+        Sends points as expected by InfluxDBClient.write_points, see write_lines.
+        """
+        return self.write_lines(make_lines({'points': points}).encode('utf-8'), using=using)
 
-    def write_points(self, points):
-        return self.get_client().write_points(points, database=self.database)
+    def write_lines(self, body: bytes, precision: str = 'n', using: str = None) -> TransferStats:
+        """
+        Sends an already encoded line protocol body, gzipped when the connection enables it.
+        :param body: the line protocol body
+        :param precision: the precision of the timestamps in body
+        :param using: the database alias
+        :return: the size of body and of what was sent
+        """
+        params = {'db': self.get_database(using), 'precision': precision}
+        connection = self.get_connection(using)
+        data, headers = connection.compress(body)
+        headers['Content-Type'] = 'application/octet-stream'
 
-    def create_database(self):
-        return self.get_client().create_database(self.database)
+        self.call(lambda client: client.request(url='write',
+                                                method='POST',
+                                                params=params,
+                                                data=data,
+                                                expected_response_code=204,
+                                                headers=headers),
+                  using=using)
+        stats = TransferStats(raw_bytes=len(body), wire_bytes=len(data))
+        connection.record('sent', stats)
+        return stats
 
-    def drop_database(self):
-        return self.get_client().drop_database(self.database)
+    def _after_fork(self):
+        if self.buffer is not None:
+            # the writer thread did not survive the fork, pending points are left to the parent.
+            # the clone starts its own thread on its first put().
+            self.buffer = self.buffer.clone()
+
+    def enable_buffering(self, **kwargs) -> BufferedWriter:
+        """
+        Makes InfluxMeasurement.save() queue its point, points being written from a background thread.
+        :param kwargs: BufferedWriter options (batch_size, max_latency, max_queue_size, block, put_timeout)
+        :return: the buffered writer, which exposes metrics
+        """
+        if self.buffer is not None:
+            self.buffer.close()
+        self.buffer = BufferedWriter(self.write_lines, **kwargs)
+        return self.buffer
+
+    def disable_buffering(self):
+        """Flushes pending points and goes back to synchronous writes."""
+        if self.buffer is not None:
+            self.buffer.close()
+            self.buffer = None
+
+    def create_database(self, using=None):
+        database = self.get_database(using)
+        return self.call(lambda client: client.create_database(database), using=using)
+
+    def drop_database(self, using=None):
+        database = self.get_database(using)
+        return self.call(lambda client: client.drop_database(database), using=using)
 
     def drop_measurements(self):
         measurements = self.query('SHOW MEASUREMENTS')
@@ -93,3 +515,13 @@ class InfluxClientWrapper(metaclass=SingletonMetaClass):
 
 
 client_wrapper = InfluxClientWrapper()
+
+
+def _after_fork():
+    for connection in list(_connections):
+        connection._after_fork()
+    client_wrapper._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
@@ -0,0 +1,64 @@
+from array import array
+from collections import OrderedDict, namedtuple
+from typing import List, Sequence
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
+class InfluxColumns(namedtuple('InfluxColumns', ['columns', 'tags'])):
+    """A series stored column-wise, columns maps each column name to an array of values."""
+
+    def __len__(self):
+        for column in self.columns.values():
+            return len(column)
+        return 0
+
+
+def to_array(values: Sequence, integer: bool = False):
+    """
+    Packs a column into a numpy array, or an array.array when numpy is not installed.
+
+    Integer columns become int64, numeric columns with nulls become float64 holding NaN,
+    other columns are left as object arrays (lists without numpy).
+    :param values: the column values
+    :param integer: forces an int64 column, used for epoch timestamps
+    """
+    types = set(map(type, values))
+
+    if integer or types <= {int}:
+        typecode, dtype = 'q', 'int64'
+    elif types <= {int, float, type(None)}:
+        typecode, dtype = 'd', 'float64'
+        values = [float('nan') if value is None else value for value in values]
+    elif types == {bool}:
+        typecode, dtype = None, 'bool'
+    else:
+        typecode, dtype = None, 'object'
+
+    if numpy is not None:
+        return numpy.array(values, dtype=dtype)
+    if typecode is None:
+        return list(values)
+    return array(typecode, values)
+
+
+def columns_from_raw(raw: dict) -> List[InfluxColumns]:
+    """
+    Builds InfluxColumns from the raw result of a query sent with an epoch precision.
+    :param raw: the raw result (as ResultSet.raw)
+    """
+    results = []
+    for serie in raw.get('series', []):
+        names = serie['columns']
+        values = serie.get('values') or []
+        transposed = list(zip(*values)) if values else [()] * len(names)
+
+        columns = OrderedDict()
+        for name, column in zip(names, transposed):
+            columns[name] = to_array(column, integer=(name == 'time'))
+
+        results.append(InfluxColumns(columns=columns, tags=serie.get('tags')))
+    return results
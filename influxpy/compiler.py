@@ -1,20 +1,128 @@
+import os
+import threading
+import weakref
+from collections import OrderedDict, namedtuple
 from typing import List
 
-from influxpy.fields import BaseDuration
+from influxpy.aggregates import Raw
+from influxpy.fields import BaseDuration, InfluxTimeField
 from influxpy.query import InfluxQuery
 
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+# every compiler, so forked children can replace their locks.
+_compilers = weakref.WeakSet()
+
+
+class CompiledQuery(object):
+    """
+    An iql query where the filter values are left out, so queries differing only by
+    their filter values (e.g. time bounds) share it.
+    """
+
+    def __init__(self, head: str, lookups: list, tail: str):
+        self.head = head
+        self.lookups = lookups
+        self.tail = tail
+
+    def render(self, query: InfluxQuery) -> str:
+        filters = [lookup.as_iql(value) for lookup, value in zip(self.lookups, query.filters.values())]
+        if not filters:
+            return self.head + self.tail
+        return self.head + ' WHERE ' + ' AND '.join(filters) + self.tail
+
 
 class InfluxCompiler(object):
+    cache_size = 512
+
     def __init__(self, model):
         super().__init__()
         self.model = model
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._stored_funcs = None
+        _compilers.add(self)
+
+    def _after_fork(self):
+        # another thread of the parent may have held the lock when forking.
+        self._cache_lock = threading.Lock()
 
     def get_table_for_time(self, query):
-        if query.can_use_aggregated_measurement:
-            mapping = getattr(self.model._meta, 'aggregated_measurements', {})
-            return mapping.get(query.resolution, self.model.measurement)
+        return self.plan(query)[0]
+
+    @staticmethod
+    def target_interval(query: InfluxQuery):
+        """
+        Seconds between two returned points: the resolution, or the time range divided by max_points.
+        """
+        if isinstance(query.resolution, BaseDuration):
+            return query.resolution.total_seconds()
+
+        lower, upper = query.time_bounds()
+        if query.max_points and lower is not None and upper is not None:
+            seconds = (InfluxTimeField.epoch_value(upper) - InfluxTimeField.epoch_value(lower)) // 1000000000
+            return max(-(-seconds // query.max_points), 1)
+
+        return None
+
+    def plan(self, query: InfluxQuery) -> tuple:
+        """
+        Picks the measurement a query reads from.
 
-        return self.model.measurement
+        When downsampled measurements can be used, the coarsest one whose interval divides the resolution
+        is chosen and the annotations are rewritten to aggregate the downsampled values. Without resolution,
+        the finest downsampled measurement keeping the query under max_points is chosen.
+
+        Rollups declared in Meta.rollups are only read when they stored each annotated field with the same
+        aggregate, measurements of Meta.aggregated_measurements are trusted to. Approximate rollups (means
+        of means) are only used when the query allows them.
+        :return: (measurement, query)
+        """
+        raw = (self.model.measurement, query)
+        if not query.can_use_aggregated_measurement:
+            return raw
+
+        mapping = self.model._meta.aggregated_measurements
+        if query.resolution is not None and not isinstance(query.resolution, BaseDuration):
+            return mapping.get(query.resolution, self.model.measurement), query
+
+        annotations = tuple(annotation.rollup() for annotation in query.annotations)
+        interval = self.target_interval(query)
+        if interval is None or any(annotation is None for annotation in annotations):
+            return raw
+        if not query.mean_of_means and not all(annotation.rollup_exact for annotation in query.annotations):
+            return raw
+
+        # from the coarsest to the finest, a measurement is never read to write into itself.
+        rollups = sorted(((duration.total_seconds(), measurement)
+                          for duration, measurement in mapping.items()
+                          if measurement != query.destination and self.stores(measurement, query.annotations)),
+                         reverse=True)
+
+        if query.resolution is not None:
+            candidates = [measurement for seconds, measurement in rollups
+                          if seconds <= interval and interval % seconds == 0]
+        else:
+            candidates = [measurement for seconds, measurement in reversed(rollups) if seconds >= interval]
+            candidates = candidates or [measurement for _, measurement in rollups]
+
+        if not candidates:
+            return raw
+
+        return candidates[0], query.replace(annotations=annotations)
+
+    def stores(self, measurement: str, annotations: tuple) -> bool:
+        """Tells whether a downsampled measurement stores the fields of annotations with their aggregate."""
+        if self._stored_funcs is None:
+            self._stored_funcs = {rollup.table: rollup.stored_funcs(self.model) for rollup in self.model._meta.rollups}
+
+        funcs = self._stored_funcs.get(measurement)
+        if funcs is None:
+            return True
+        return all(field in funcs and funcs[field] == getattr(annotation, 'func', None)
+                   for annotation in annotations for field in annotation.fields())
 
     def compile_group_by(self, query: InfluxQuery) -> List[str]:
         parts = []
@@ -32,10 +140,28 @@ class InfluxCompiler(object):
 
         return parts
 
+    def compile_projection(self, query: InfluxQuery) -> List[str]:
+        fields = self.model._meta.fields
+        tags = self.model._meta.tags
+        for name in query.projection:
+            if name not in fields and name not in tags:
+                raise RuntimeError('Field "{}" does not exists for "{}"'.format(name, self.model.__name__))
+        if query.projection and not query.annotations and not any(name in fields for name in query.projection):
+            raise RuntimeError('Influxdb returns nothing when only tags are selected.')
+        # raw aggregates cannot be told apart, influxdb checks them.
+        aggregates = [annotation for annotation in query.annotations if not isinstance(annotation, Raw)]
+        if query.projection and aggregates and (len(query.annotations) > 1 or not aggregates[0].selector):
+            raise ValueError('Fields and tags can only be selected next to a single selector (e.g. Max, First), '
+                             'got {}.'.format(', '.join(annotation.as_iql() for annotation in query.annotations)))
+        return [self.quote_identifier(name) for name in query.projection]
+
     def compile_selected_fields(self, query: InfluxQuery) -> List[str]:
-        parts = []
+        parts = self.compile_projection(query)
         if query.annotations:
             for annotation in query.annotations:
+                for field in annotation.fields():
+                    if field != '*' and field not in self.model._meta.fields:
+                        raise RuntimeError('Field "{}" does not exists for "{}"'.format(field, self.model.__name__))
                 parts.append(annotation.as_iql())
         return parts
 
@@ -46,14 +172,18 @@ class InfluxCompiler(object):
         else:
             return str(value)
 
+    @staticmethod
+    def quote_identifier(name: str) -> str:
+        return '"{}"'.format(name.replace('\\', '\\\\').replace('"', '\\"'))
+
     @staticmethod
     def single_quote(value: str) -> str:
         return "'{value}'".format(value=value)
 
-    def compile_where(self, query: InfluxQuery) -> str:
-        filters = []
+    def compile_lookups(self, query: InfluxQuery) -> list:
+        lookups = []
 
-        for f, value in query.filters.items():
+        for f in query.filters.keys():
             if '__' in f:
                 field_name, lookup_key = f.split('__')
             else:
@@ -65,17 +195,26 @@ class InfluxCompiler(object):
             except KeyError:
                 raise RuntimeError('Field "{}" does not exists for "{}"'.format(field_name, self.model.__name__))
 
-            lookup = field.get_lookup(lookup_key)
+            lookups.append(field.get_lookup(lookup_key))
+
+        return lookups
+
+    def compile_where(self, query: InfluxQuery) -> str:
+        filters = []
+
+        for lookup, value in zip(self.compile_lookups(query), query.filters.values()):
             if lookup is not None:
                 filters.append(lookup.as_iql(value))
 
         return ' AND '.join(filters)
 
-    def get_query_parts(self, query: InfluxQuery) -> List[str]:
+    def get_query_parts(self, query: InfluxQuery, where=None, table_name=None) -> List[str]:
+        if table_name is None:
+            table_name, query = self.plan(query)
         selected_fields = self.compile_selected_fields(query)
-        where = self.compile_where(query)
+        if where is None:
+            where = self.compile_where(query)
         group_by = self.compile_group_by(query)
-        table_name = self.get_table_for_time(query)
         resolution = query.resolution
         destination = query.destination
         fill = query.fill
@@ -103,7 +242,95 @@ class InfluxCompiler(object):
             parts.append(', '.join(group_by))
             if fill is not None:
                 parts.append('fill({})'.format(str(fill)))
+
+        if query.descending:
+            parts.append('ORDER BY time DESC')
+
+        for clause, value in (('LIMIT', query.limit),
+                              ('OFFSET', query.offset),
+                              ('SLIMIT', query.series_limit),
+                              ('SOFFSET', query.series_offset)):
+            if value is not None:
+                parts.append('{} {:d}'.format(clause, value))
         return parts
 
+    @staticmethod
+    def fingerprint(query: InfluxQuery) -> tuple:
+        """
+        Hashable key describing everything but the filter values of query.
+        """
+        resolution = query.resolution
+        if isinstance(resolution, BaseDuration):
+            resolution = resolution.as_iql()
+
+        return (
+            resolution,
+            tuple(query.group_by),
+            tuple(query.filters.keys()),
+            tuple(annotation.as_iql() for annotation in query.annotations),
+            None if query.fill is None else str(query.fill),
+            query.destination,
+            query.can_use_aggregated_measurement,
+            query.max_points,
+            query.descending,
+            query.limit,
+            query.offset,
+            query.series_limit,
+            query.series_offset,
+            query.projection,
+        )
+
+    def compile_template(self, query: InfluxQuery, table_name: str) -> CompiledQuery:
+        parts = self.get_query_parts(query, where='', table_name=table_name)
+        lookups = self.compile_lookups(query)
+        # WHERE always follows FROM and the table name.
+        split = parts.index('FROM') + 2
+        tail = ' '.join(parts[split:])
+        return CompiledQuery(head=' '.join(parts[:split]),
+                             lookups=lookups,
+                             tail=' ' + tail if tail else '')
+
+    def cache_info(self) -> CacheInfo:
+        with self._cache_lock:
+            return CacheInfo(hits=self.hits, misses=self.misses, maxsize=self.cache_size, currsize=len(self._cache))
+
+    def cache_clear(self):
+        with self._cache_lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+
     def compile(self, query: InfluxQuery) -> str:
-        return ' '.join(self.get_query_parts(query))
+        if query.is_empty():
+            # LIMIT 0 would return every point, empty query sets are not sent.
+            raise RuntimeError('An empty query set has no query.')
+
+        # the plan may depend on the time bounds, the chosen measurement is part of the key.
+        table_name, query = self.plan(query)
+        key = self.fingerprint(query) + (table_name,)
+
+        with self._cache_lock:
+            template = self._cache.get(key)
+            if template is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if template is None:
+            template = self.compile_template(query, table_name)
+            with self._cache_lock:
+                self._cache[key] = template
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        return template.render(query)
+
+
+def _after_fork():
+    for compiler in list(_compilers):
+        compiler._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
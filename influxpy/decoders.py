@@ -0,0 +1,226 @@
+import csv
+import io
+import json
+import struct
+import time
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import ujson
+except ImportError:  # pragma: no cover
+    ujson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+JSON = 'json'
+CSV = 'csv'
+MSGPACK = 'msgpack'
+
+CONTENT_TYPES = {
+    JSON: 'application/json',
+    CSV: 'application/csv',
+    MSGPACK: 'application/x-msgpack',
+}
+
+# msgpack extension type of the timestamps sent by influxdb (https://github.com/tinylib/msgp)
+MSGPACK_TIME_EXTENSION = 5
+
+
+def get_json_loads():
+    """Returns the fastest installed json parser: orjson, ujson, then the standard library."""
+    if orjson is not None:
+        return orjson.loads
+    if ujson is not None:
+        return ujson.loads
+    return json.loads
+
+
+json_loads = get_json_loads()
+
+
+def format_rfc3339(nanoseconds: int) -> str:
+    """Formats nanoseconds since epoch as influxdb does in json responses."""
+    seconds, nanoseconds = divmod(nanoseconds, 1000000000)
+    text = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(seconds))
+    if nanoseconds:
+        text += '.' + '{:09d}'.format(nanoseconds).rstrip('0')
+    return text + 'Z'
+
+
+def format_times(document: dict) -> dict:
+    """Formats the nanosecond timestamps of the time columns of document as RFC3339 strings, in place."""
+    for result in document.get('results', []):
+        for serie in result.get('series', []):
+            if serie.get('columns', [])[:1] == ['time']:
+                for values in serie.get('values') or []:
+                    if isinstance(values[0], int):
+                        values[0] = format_rfc3339(values[0])
+    return document
+
+
+def decode_json(body: bytes, epoch: str = None) -> dict:
+    """
+    Decodes a json query response body.
+    :param body: the raw http body
+    :param epoch: the precision requested for timestamps, unused as json keeps them as sent
+    :return: the response document, holding the raw result of each statement in results
+    """
+    return json_loads(body)
+
+
+def _split_escaped(text: str, separator: str) -> list:
+    parts = ['']
+    escaped = False
+    for char in text:
+        if escaped:
+            parts[-1] += char
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif char == separator:
+            parts.append('')
+        else:
+            parts[-1] += char
+    return parts
+
+
+def _csv_tags(text: str) -> dict:
+    """Parses the tags column, formatted as the escaped key=value pairs of a series key."""
+    if not text:
+        return None
+    tags = {}
+    for pair in _split_escaped(text.replace('\\=', '\0'), ','):
+        key, _, value = pair.partition('=')
+        tags[key.replace('\0', '=')] = value.replace('\0', '=')
+    return tags
+
+
+def _csv_value(text: str):
+    if text == '':
+        return None
+    if text in ('true', 'false'):
+        return text == 'true'
+    for parse in (int, float):
+        try:
+            return parse(text)
+        except ValueError:
+            pass
+    return text
+
+
+def _csv_parser(text: str):
+    """
+    Returns the parser of a column from one of its values, columns of a series holding a single type
+    (but integers sent for floats without decimals).
+    """
+    value = _csv_value(text)
+    if isinstance(value, bool) or isinstance(value, str):
+        return _csv_value
+    parse = type(value)
+
+    def parser(text):
+        if text == '':
+            return None
+        try:
+            return parse(text)
+        except ValueError:
+            return _csv_value(text)
+    return parser
+
+
+def decode_csv(body: bytes, epoch: str = None) -> dict:
+    """
+    Decodes a csv query response body.
+
+    CSV loses the types (7.0 is sent as 7) and the statement boundaries: every series is returned in
+    a single result, statements without series are skipped.
+    :param body: the raw http body
+    :param epoch: the precision requested for timestamps, which are converted to RFC3339 strings when None
+    :return: the response document, as decode_json
+    """
+    rows = csv.reader(io.StringIO(body.decode('utf-8')))
+    series = []
+    header = None
+    parsers = None
+    tags_cache = {}
+    for row in rows:
+        if not row:
+            # a blank line is followed by the header of the next columns.
+            header = None
+            continue
+        if header is None:
+            if row == ['error']:
+                return {'error': next(rows)[0]}
+            header = row
+            parsers = [None] * (len(header) - 2)
+            continue
+
+        name = row[0]
+        tags = tags_cache.get(row[1])
+        if tags is None:
+            tags = tags_cache[row[1]] = _csv_tags(row[1]) or {}
+
+        values = row[2:]
+        for index, text in enumerate(values):
+            parser = parsers[index]
+            if parser is None and text != '':
+                parser = parsers[index] = _csv_parser(text)
+            values[index] = None if parser is None else parser(text)
+        if header[2:3] == ['time'] and epoch is None and isinstance(values[0], int):
+            values[0] = format_rfc3339(values[0])
+
+        current = series[-1] if series else None
+        if current is None or current['name'] != name or current.get('tags', {}) != tags or \
+                current['columns'] != header[2:]:
+            current = {'name': name, 'columns': header[2:], 'values': []}
+            if tags:
+                current['tags'] = tags
+            series.append(current)
+        current['values'].append(values)
+
+    result = {'statement_id': 0}
+    if series:
+        result['series'] = series
+    return {'results': [result]}
+
+
+def _msgpack_extension(code: int, data: bytes):
+    if code == MSGPACK_TIME_EXTENSION:
+        seconds, nanoseconds = struct.unpack('>qi', data)
+        return format_rfc3339(seconds * 1000000000 + nanoseconds)
+    return msgpack.ExtType(code, data)
+
+
+def decode_msgpack(body: bytes, epoch: str = None) -> dict:
+    """
+    Decodes a msgpack query response body, timestamps are returned as in json responses.
+    :param body: the raw http body
+    :param epoch: the precision requested for timestamps, unused as they are typed
+    :return: the response document, as decode_json
+    """
+    if msgpack is None:
+        raise RuntimeError('msgpack responses require msgpack, pip install influxpy[msgpack].')
+    return msgpack.unpackb(body, raw=False, ext_hook=_msgpack_extension, strict_map_key=False)
+
+
+DECODERS = {
+    JSON: decode_json,
+    CSV: decode_csv,
+    MSGPACK: decode_msgpack,
+}
+
+
+def get_decoder(content_type: str):
+    """Returns the decoder of a response content type, json being the default."""
+    content_type = (content_type or '').split(';')[0].strip()
+    for response_format, known_content_type in CONTENT_TYPES.items():
+        if content_type == known_content_type:
+            return DECODERS[response_format]
+    return decode_json
@@ -0,0 +1,57 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from influxpy.client import client_wrapper
+from influxpy.queryset import InfluxQuerySet, InfluxSeries
+
+PACK = 'pack'
+THREADS = 'threads'
+
+
+def _fetch(queryset: InfluxQuerySet) -> List[InfluxSeries]:
+    return list(queryset)
+
+
+def _gather_packed(querysets) -> List[List[InfluxSeries]]:
+    results = [None] * len(querysets)
+    by_database = OrderedDict()
+
+    for index, queryset in enumerate(querysets):
+        if queryset.query.is_empty():
+            results[index] = []
+        elif queryset.query.cache_ttl is not None or queryset.query.time_split is not None:
+            # cached query sets are served (or refreshed) by the result cache, split ones by their chunks.
+            results[index] = _fetch(queryset)
+        else:
+            by_database.setdefault(queryset.query.database, []).append(index)
+
+    for database, indexes in by_database.items():
+        statements = [querysets[index].iql_query() for index in indexes]
+        raws = client_wrapper.query_raw('; '.join(statements), using=database)
+
+        for position, index in enumerate(indexes):
+            # statements without result, e.g. against an empty database, return no series.
+            results[index] = list(InfluxQuerySet._series_from_raw(raws[position])) if position < len(raws) else []
+
+    return results
+
+
+def gather(*querysets: InfluxQuerySet, mode: str = PACK, max_workers: int = 8) -> List[List[InfluxSeries]]:
+    """
+    Evaluates several query sets at once, results being returned in the order of the query sets.
+
+    In 'pack' mode the queries sent to a same database are joined in a single request,
+    in 'threads' mode each query is sent from a thread pool of max_workers threads.
+    :param querysets: the query sets to evaluate
+    :param mode: 'pack' or 'threads'
+    :param max_workers: size of the thread pool in 'threads' mode
+    :return: the list of series of each query set
+    """
+    if mode == PACK:
+        return _gather_packed(querysets)
+    elif mode == THREADS:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(_fetch, querysets))
+
+    raise ValueError('Unknown gather mode "{}".'.format(mode))
@@ -1,3 +1,4 @@
+import calendar
 import inspect
 import logging
 
@@ -100,6 +101,33 @@ class InfluxTimeField(InfluxLookupField):
         """
         return value.strftime(self.RFC3339) + "Z"
 
+    @staticmethod
+    def python_value(value) -> datetime.datetime:
+        """
+        Transforms a RFC3339 string or nanoseconds since epoch, as returned by influxdb, into a naive UTC datetime.
+        :param value: the timestamp to transform
+        :return: the datetime
+        """
+        if isinstance(value, int):
+            return datetime.datetime(1970, 1, 1) + datetime.timedelta(microseconds=value // 1000)
+        # fixed offsets are faster than strptime, influxdb always answers in UTC.
+        microsecond = 0
+        if len(value) > 20 and value[19] == '.':
+            microsecond = int(value[20:-1].ljust(6, '0')[:6])
+        return datetime.datetime(int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                                 int(value[11:13]), int(value[14:16]), int(value[17:19]), microsecond)
+
+    @staticmethod
+    def epoch_value(value: datetime.datetime) -> int:
+        """
+        Transforms a datetime into nanoseconds since epoch, naive datetimes being considered as UTC.
+        :param value: the datetime to transform
+        :return: the timestamp in nanoseconds
+        """
+        if isinstance(value, int):
+            return value
+        return calendar.timegm(value.utctimetuple()) * 1000000000 + value.microsecond * 1000
+
     def contribute_to_class(self, cls, name):
         super().contribute_to_class(cls, name)
         cls._meta.set_time(self)
@@ -107,10 +135,14 @@ class InfluxTimeField(InfluxLookupField):
 
 class BaseDuration(object):
     unit = None
+    seconds = None
 
     def __init__(self, value):
         self.value = value
 
+    def total_seconds(self) -> int:
+        return int(self.value) * self.seconds
+
     def as_iql(self):
         try:
             return '{value}{unit}'.format(value=int(self.value), unit=self.unit)
@@ -118,23 +150,27 @@ class BaseDuration(object):
             raise ValueError('Durations must be integers.')
 
     def __eq__(self, o: 'BaseDuration') -> bool:
-        return self.value == o.value
+        return isinstance(o, BaseDuration) and self.total_seconds() == o.total_seconds()
 
     def __hash__(self) -> int:
-        return self.value.__hash__()
+        return self.total_seconds().__hash__()
 
 
 class Seconds(BaseDuration):
     unit = 's'
+    seconds = 1
 
 
 class Minutes(BaseDuration):
     unit = 'm'
+    seconds = 60
 
 
 class Hours(BaseDuration):
     unit = 'h'
+    seconds = 3600
 
 
 class Days(BaseDuration):
     unit = 'd'
+    seconds = 86400
@@ -0,0 +1,96 @@
+from typing import Iterable
+
+
+def escape_measurement(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace(',', '\\,').replace(' ', '\\ ')
+
+
+def escape_key(value) -> str:
+    """Escapes tag keys, tag values and field keys."""
+    return str(value).replace('\\', '\\\\').replace(',', '\\,').replace(' ', '\\ ').replace('=', '\\=')
+
+
+def encode_field_value(value) -> str:
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, int):
+        return '{}i'.format(value)
+    if isinstance(value, float):
+        return repr(value)
+    return '"{}"'.format(str(value).replace('\\', '\\\\').replace('"', '\\"'))
+
+
+class LineProtocolEncoder(object):
+    """
+    Serializes measurements to line protocol.
+
+    Escaped keys and the tags order are computed once per model when the class is created,
+    timestamps are written as nanoseconds since epoch.
+    """
+
+    def __init__(self):
+        self.model = None
+        self.measurement = None
+        self.tags = []
+        self.fields = []
+        self.time_field = None
+
+    def contribute_to_class(self, model, name):
+        self.model = model
+        if model.measurement is not None:
+            self.measurement = escape_measurement(model.measurement)
+        # tags are sorted by key as advised by influxdb to speed up the server side.
+        self.tags = [(tag, ',' + escape_key(tag_name) + '=') for tag_name, tag in sorted(model._meta.tags.items())]
+        self.fields = [(field, escape_key(field_name) + '=') for field_name, field in sorted(model._meta.fields.items())]
+        self.time_field = model._meta.all_fields.get('time')
+        setattr(model, name, self)
+
+    def encode(self, instance) -> str:
+        """
+        Encodes a measurement instance into a single line (without the trailing newline).
+        :param instance: the measurement to encode
+        :return: the line protocol string
+        """
+        if self.measurement is None:
+            raise RuntimeError('measurement cannot be None.')
+
+        parts = [self.measurement]
+        for tag, key in self.tags:
+            value = tag.db_value(getattr(instance, tag.name, None))
+            if value is not None and value != '':
+                parts.append(key)
+                parts.append(escape_key(value))
+
+        separator = ' '
+        for field, key in self.fields:
+            value = field.db_value(getattr(instance, field.name, None))
+            if value is not None:
+                parts.append(separator)
+                parts.append(key)
+                parts.append(encode_field_value(value))
+                separator = ','
+
+        if separator == ' ':
+            raise RuntimeError('A point needs at least one field value.')
+
+        timestamp = getattr(instance, 'time', None)
+        if timestamp is not None:
+            parts.append(' ')
+            parts.append(str(self.time_field.epoch_value(timestamp)))
+
+        return ''.join(parts)
+
+    def encode_many(self, instances: Iterable) -> bytes:
+        """
+        Encodes measurements into a request body.
+        :param instances: the measurements to encode
+        :return: the utf-8 encoded body, one line per measurement.
+        """
+        return join_lines(self.encode(instance) for instance in instances)
+
+
+def join_lines(lines: Iterable[str]) -> bytes:
+    body = '\n'.join(lines)
+    if not body:
+        return b''
+    return (body + '\n').encode('utf-8')
@@ -0,0 +1,148 @@
+import copy
+from collections import OrderedDict
+from typing import Iterable, List, Sequence
+
+from influxpy.aggregates import BaseAggregate, Transformation
+from influxpy.columns import InfluxColumns, numpy, to_array
+from influxpy.fields import BaseDuration, InfluxTimeField
+from influxpy.queryset import InfluxSeries
+
+# nanoseconds per unit of the epoch precisions accepted by influxdb.
+EPOCH_PRECISIONS = {'ns': 1, 'u': 1000, 'ms': 1000000, 's': 1000000000, 'm': 60000000000, 'h': 3600000000000}
+
+
+def _series_columns(serie, names: Sequence[str]) -> dict:
+    """Returns the names columns of an InfluxSeries or InfluxColumns as lists or arrays."""
+    if isinstance(serie, InfluxColumns):
+        return {name: serie.columns[name] if name in serie.columns else [None] * len(serie) for name in names}
+
+    if serie.points and not isinstance(serie.points[0], dict) and not hasattr(serie.points[0], '_asdict'):
+        # values_list() points do not name their values.
+        raise ValueError('Points of values_list() series must be namedtuples, use values_list(named=True).')
+    points = [point if isinstance(point, dict) else point._asdict() for point in serie.points]
+    return {name: [point.get(name) for point in points] for name in names}
+
+
+def _concatenate(parts: list):
+    if numpy is not None:
+        return numpy.concatenate([numpy.asarray(part) for part in parts])
+    return [value for part in parts for value in part]
+
+
+def _buckets(times: Sequence[int], step: int) -> list:
+    """
+    Groups the indices of times by time bucket, in time order inside a bucket.
+    :return: (bucket, indices) sorted by bucket, indices being an array when numpy is installed
+    """
+    if numpy is not None:
+        times = numpy.asarray(times, dtype='int64')
+        if not len(times):
+            return []
+        order = numpy.argsort(times, kind='stable')
+        keys = numpy.zeros(len(times), dtype='int64') if step is None else times[order] - times[order] % step
+        starts = numpy.flatnonzero(numpy.diff(keys)) + 1
+        return list(zip(keys[numpy.r_[0, starts]].tolist(), numpy.split(order, starts)))
+
+    buckets = OrderedDict()
+    for index in sorted(range(len(times)), key=times.__getitem__):
+        time = times[index]
+        buckets.setdefault(0 if step is None else time - time % step, []).append(index)
+    return list(buckets.items())
+
+
+def _take(column: Sequence, indices):
+    if numpy is not None:
+        return column[indices]
+    return [column[index] for index in indices]
+
+
+def _evaluate(aggregate: BaseAggregate, columns: dict, buckets: list, precision: int) -> list:
+    """Returns the values of aggregate for each bucket."""
+    if isinstance(aggregate, Transformation):
+        if not isinstance(aggregate.measurement, BaseAggregate):
+            raise RuntimeError('{} transforms points, not buckets, see Transformation.transform().'.format(
+                aggregate.as_iql()))
+        values = _evaluate(aggregate.measurement, columns, buckets, precision)
+        return aggregate.transform([bucket for bucket, _ in buckets], values, precision)
+
+    fields = aggregate.fields()
+    column = columns[fields[0]] if fields else None
+    return [aggregate.evaluate([] if column is None else _take(column, indices)) for _, indices in buckets]
+
+
+def aggregate(results: Iterable,
+              *aggregates: BaseAggregate,
+              resolution: BaseDuration = None,
+              group_by: Sequence[str] = (),
+              epoch: str = 'ns',
+              **named_aggregates: BaseAggregate) -> List:
+    """
+    Aggregates already fetched series like influxdb would, without another query.
+
+    Series sharing the group_by tags are merged, other tags are dropped, then points are bucketed
+    by resolution and each aggregate is evaluated per bucket. Unlike influxdb, buckets without
+    points are left out.
+    :param results: InfluxSeries, e.g. from several query sets or values_list(named=True), or InfluxColumns
+        from to_columns()
+    :param aggregates: the aggregates, evaluated with BaseAggregate.evaluate
+    :param resolution: the bucket duration, all points fall in a bucket at epoch 0 when None
+    :param group_by: the tags kept
+    :param epoch: precision of integer timestamps, as passed to to_columns()
+    :param named_aggregates: aggregates returned under the given column name
+    :return: InfluxColumns when results are InfluxColumns, InfluxSeries otherwise
+    """
+    results = list(results)
+    aggregates = list(aggregates)
+    for name, named in named_aggregates.items():
+        named = copy.copy(named)
+        named.name = name
+        aggregates.append(named)
+
+    names = ['time'] + sorted({field for aggregate in aggregates for field in aggregate.fields()})
+
+    groups = OrderedDict()
+    for serie in results:
+        tags = serie.tags or {}
+        key = tuple(tags.get(tag) for tag in group_by)
+        columns = _series_columns(serie, names)
+        parts = groups.setdefault(key, {name: [] for name in names})
+        for name in names:
+            parts[name].append(columns[name])
+
+    as_columns = bool(results) and isinstance(results[0], InfluxColumns)
+    # RFC3339 timestamps are bucketed as nanoseconds and returned as RFC3339 too.
+    rfc3339 = not as_columns and any(isinstance(time, str)
+                                     for parts in groups.values() for part in parts['time'] for time in part[:1])
+    precision = EPOCH_PRECISIONS['ns' if rfc3339 else epoch]
+    step = None
+    if resolution is not None:
+        step = resolution.total_seconds() * 1000000000 // precision
+
+    output = []
+    for key, parts in groups.items():
+        times = _concatenate(parts['time'])
+        if rfc3339:
+            times = [InfluxTimeField.epoch_value(InfluxTimeField.python_value(time)) for time in times]
+        buckets = _buckets(times, step)
+        columns = {name: _concatenate(parts[name]) for name in names[1:]}
+
+        result = OrderedDict()
+        result['time'] = [bucket for bucket, _ in buckets]
+        for aggregate in aggregates:
+            result[aggregate.column] = _evaluate(aggregate, columns, buckets, precision)
+
+        tags = OrderedDict(zip(group_by, key)) if group_by else None
+        if as_columns:
+            output.append(InfluxColumns(
+                columns=OrderedDict((name, to_array(values, integer=(name == 'time')))
+                                    for name, values in result.items()),
+                tags=tags))
+            continue
+
+        if rfc3339:
+            time_field = InfluxTimeField()
+            result['time'] = [time_field.db_value(InfluxTimeField.python_value(time)) for time in result['time']]
+        points = [dict(zip(result.keys(), values)) for values in zip(*result.values())]
+        output.append(InfluxSeries(points=points, tags=tags))
+
+    return output
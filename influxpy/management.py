@@ -0,0 +1,253 @@
+import hashlib
+import logging
+import re
+from collections import OrderedDict, namedtuple
+from typing import Dict, List
+
+from influxpy.aggregates import BaseAggregate, Mean
+from influxpy.client import client_wrapper
+from influxpy.compiler import InfluxCompiler
+from influxpy.fields import BaseDuration
+from influxpy.model import ContinuousQuery, InfluxMeasurement
+from influxpy.queryset import InfluxQuerySet
+
+logger = logging.getLogger('influxpy.management')
+
+quote_identifier = InfluxCompiler.quote_identifier
+
+Operation = namedtuple('Operation', ['action', 'kind', 'name', 'statement'])
+
+DURATION_UNITS = {'w': 604800, 'd': 86400, 'h': 3600, 'm': 60, 's': 1}
+
+
+def parse_duration(value: str) -> int:
+    """
+    Transforms a duration returned by influxdb (e.g. 168h0m0s) into seconds, sub-second parts are ignored.
+    :param value: the influxdb duration
+    :return: the seconds, 0 meaning infinite
+    """
+    return sum(int(amount) * DURATION_UNITS[unit]
+               for amount, unit in re.findall(r'(\d+)([a-zµ]+)', value) if unit in DURATION_UNITS)
+
+
+class RetentionPolicy(object):
+    """
+    Retention policy of a rollup, duration None keeps the data forever.
+    """
+
+    def __init__(self,
+                 name: str,
+                 duration: BaseDuration = None,
+                 replication: int = 1,
+                 shard_duration: BaseDuration = None,
+                 default: bool = False):
+        self.name = name
+        self.duration = duration
+        self.replication = replication
+        self.shard_duration = shard_duration
+        self.default = default
+
+    def qualify(self, measurement: str) -> str:
+        return '{}.{}'.format(quote_identifier(self.name), quote_identifier(measurement))
+
+    def iql_query(self, database: str, action: str = 'CREATE') -> str:
+        parts = [
+            action,
+            'RETENTION POLICY',
+            quote_identifier(self.name),
+            'ON',
+            quote_identifier(database),
+            'DURATION',
+            self.duration.as_iql() if self.duration else 'INF',
+            'REPLICATION',
+            str(self.replication)
+        ]
+
+        if self.shard_duration:
+            parts.append('SHARD DURATION')
+            parts.append(self.shard_duration.as_iql())
+
+        if self.default:
+            parts.append('DEFAULT')
+
+        return ' '.join(parts)
+
+    def differs(self, row: dict) -> bool:
+        """
+        Tells whether a row of SHOW RETENTION POLICIES must be altered to match this policy.
+        """
+        duration = self.duration.total_seconds() if self.duration else 0
+        if parse_duration(row['duration']) != duration or row['replicaN'] != self.replication:
+            return True
+        if self.shard_duration and parse_duration(row['shardGroupDuration']) != self.shard_duration.total_seconds():
+            return True
+        # another policy becoming the default is the only way to stop being it.
+        return self.default and not row['default']
+
+    def __eq__(self, o: 'RetentionPolicy') -> bool:
+        return isinstance(o, RetentionPolicy) and self.iql_query('') == o.iql_query('')
+
+    def __hash__(self) -> int:
+        return hash(self.iql_query(''))
+
+
+class Rollup(object):
+    """
+    Declares a measurement downsampled from a model by a continuous query, in Meta.rollups.
+
+    By default every field is averaged and every tag is kept. The aggregates must be named
+    after the fields they aggregate so queries, and coarser rollups, can read the rollup in place
+    of the model measurement, see InfluxCompiler.plan. A field is only read for the aggregate
+    which stored it, e.g. a sum of the hourly sums, never a sum of the hourly means.
+    """
+
+    def __init__(self,
+                 resolution: BaseDuration,
+                 measurement: str,
+                 aggregates: List[BaseAggregate] = None,
+                 retention_policy: RetentionPolicy = None,
+                 group_by: List[str] = None,
+                 resample_every: BaseDuration = None,
+                 resample_for: BaseDuration = None,
+                 name: str = None):
+        self.resolution = resolution
+        self.measurement = measurement
+        self.aggregates = aggregates
+        self.retention_policy = retention_policy
+        self.group_by = group_by
+        self.resample_every = resample_every
+        self.resample_for = resample_for
+        self.name = name or 'cq_' + measurement
+
+    @property
+    def table(self) -> str:
+        """The measurement as used in queries, qualified by its retention policy."""
+        if self.retention_policy is None:
+            return self.measurement
+        return self.retention_policy.qualify(self.measurement)
+
+    def named_aggregates(self, model: InfluxMeasurement) -> Dict[str, BaseAggregate]:
+        """Returns the aggregates of the rollup by the field they are stored in."""
+        aggregates = self.aggregates
+        if aggregates is None:
+            aggregates = [Mean(field) for field in sorted(model._meta.fields)]
+
+        named = OrderedDict()
+        for aggregate in aggregates:
+            fields = aggregate.fields()
+            name = aggregate.name or (fields[0] if len(fields) == 1 else None)
+            if name is None:
+                raise RuntimeError('Rollup aggregates without field must be named, got {}.'.format(aggregate.as_iql()))
+            named[name] = aggregate
+        return named
+
+    def stored_funcs(self, model: InfluxMeasurement) -> Dict[str, str]:
+        """
+        Returns the function which computed each stored field, e.g. {'latency': 'mean'}, used by
+        InfluxCompiler.plan to only read the rollup for the same aggregates.
+        """
+        return {name: getattr(aggregate, 'func', None) for name, aggregate in self.named_aggregates(model).items()}
+
+    def queryset(self, model: InfluxMeasurement) -> InfluxQuerySet:
+        group_by = self.group_by
+        if group_by is None:
+            group_by = sorted(model._meta.tags)
+
+        return model.series.group_by(*group_by).resolution(self.resolution).annotate(**self.named_aggregates(model)) \
+            .into(self.table).use_downsampled()
+
+    def continuous_query(self, model: InfluxMeasurement, database: str) -> ContinuousQuery:
+        """
+        Returns the continuous query filling the rollup, named after the rollup and a digest of its
+        definition as influxdb cannot alter continuous queries nor return them as they were created.
+        """
+        cq = ContinuousQuery(queryset=self.queryset(model),
+                             name=self.name,
+                             source=quote_identifier(database),
+                             resample_every=self.resample_every,
+                             resample_for=self.resample_for)
+        digest = hashlib.sha1(cq.iql_query().encode('utf-8')).hexdigest()[:8]
+        cq.name = '{name}_{digest}'.format(name=self.name, digest=digest)
+        return cq
+
+
+def _series_rows(result, name: str = None) -> List[dict]:
+    rows = []
+    for series in result.raw.get('series', []):
+        if name is None or series.get('name') == name:
+            rows.extend(dict(zip(series['columns'], values)) for values in series.get('values', []))
+    return rows
+
+
+def plan(*models: InfluxMeasurement, using: str = None, prune: bool = False) -> List[Operation]:
+    """
+    Returns the statements bringing the continuous queries and retention policies of the using
+    database in line with the rollups declared by models.
+
+    Retention policies are created or altered, continuous queries of a rollup whose definition changed
+    are dropped and created again. With prune, continuous queries and retention policies which are
+    not declared are dropped too, but the default retention policy.
+    """
+    database = client_wrapper.get_database(using)
+
+    policies = {}
+    continuous_queries = {}
+    for model in models:
+        for rollup in model._meta.rollups:
+            policy = rollup.retention_policy
+            if policy is not None:
+                if policies.get(policy.name, policy) != policy:
+                    raise RuntimeError('The retention policy "{}" is declared twice differently.'.format(policy.name))
+                policies[policy.name] = policy
+            cq = rollup.continuous_query(model, database)
+            continuous_queries[cq.name] = (rollup.name, cq)
+
+    existing_policies = {row['name']: row for row in _series_rows(
+        client_wrapper.query('SHOW RETENTION POLICIES ON {}'.format(quote_identifier(database)), using=using))}
+    existing_queries = [row['name'] for row in _series_rows(
+        client_wrapper.query('SHOW CONTINUOUS QUERIES', using=using), name=database)]
+
+    operations = []
+    for name, policy in sorted(policies.items()):
+        row = existing_policies.get(name)
+        if row is None:
+            operations.append(Operation('create', 'retention policy', name, policy.iql_query(database)))
+        elif policy.differs(row):
+            operations.append(Operation('alter', 'retention policy', name, policy.iql_query(database, 'ALTER')))
+
+    # queries created from an older definition of a rollup are named after it.
+    rollup_names = {rollup_name for rollup_name, _ in continuous_queries.values()}
+    for name in existing_queries:
+        outdated = re.match(r'^(.+)_[0-9a-f]{8}$', name)
+        if name not in continuous_queries and (prune or outdated and outdated.group(1) in rollup_names):
+            operations.append(Operation('drop', 'continuous query', name, 'DROP CONTINUOUS QUERY {} ON {}'.format(
+                quote_identifier(name), quote_identifier(database))))
+
+    for name, (_, cq) in sorted(continuous_queries.items()):
+        if name not in existing_queries:
+            operations.append(Operation('create', 'continuous query', name, cq.iql_query()))
+
+    if prune:
+        for name, row in sorted(existing_policies.items()):
+            if name not in policies and not row['default']:
+                operations.append(Operation('drop', 'retention policy', name, 'DROP RETENTION POLICY {} ON {}'.format(
+                    quote_identifier(name), quote_identifier(database))))
+
+    return operations
+
+
+def sync(*models: InfluxMeasurement, using: str = None, prune: bool = False, dry_run: bool = False) -> List[Operation]:
+    """
+    Applies the statements returned by plan(), running sync again does nothing.
+    :param models: the models declaring rollups
+    :param using: the database alias
+    :param prune: drops what is not declared, see plan()
+    :param dry_run: only returns the statements
+    :return: the operations
+    """
+    operations = plan(*models, using=using, prune=prune)
+    if not dry_run:
+        for operation in operations:
+            logger.info('{action} {kind} {name}'.format(**operation._asdict()))
+            client_wrapper.query(operation.statement, using=using)
+    return operations
@@ -1,10 +1,23 @@
 import inspect
+import logging
+import time
+from collections import namedtuple
+from typing import Iterable, List
 
 import copy
+import requests
+from influxdb.exceptions import InfluxDBClientError, InfluxDBServerError
+
+from influxpy.aio import async_client_wrapper
 from influxpy.client import client_wrapper
 from influxpy.fields import InfluxBaseField, InfluxTimeField, BaseDuration
+from influxpy.line_protocol import LineProtocolEncoder, join_lines
 from influxpy.queryset import InfluxQuerySet
 
+logger = logging.getLogger('influxpy.model')
+
+BatchReport = namedtuple('BatchReport', ['index', 'size', 'duration', 'error', 'transfer'])
+
 
 class Options(object):
     def __init__(self, meta, base_meta):
@@ -19,9 +32,15 @@ class Options(object):
             self.all_fields = copy.deepcopy(base_meta.all_fields)
 
         if meta:
-            self.aggregated_measurements = copy.deepcopy(getattr(meta, 'aggregated_measurements'))
+            self.aggregated_measurements = copy.deepcopy(getattr(meta, 'aggregated_measurements', {}))
+            self.rollups = list(getattr(meta, 'rollups', []))
         else:
             self.aggregated_measurements = {}
+            self.rollups = []
+
+        # rollups are read in place of the measurement, see influxpy.management.Rollup
+        for rollup in self.rollups:
+            self.aggregated_measurements.setdefault(rollup.resolution, rollup.table)
 
     def add_field(self, field):
         self.all_fields[field.name] = field
@@ -63,6 +82,8 @@ class InfluxMeasurementBase(type):
                 new_class.add_to_class(name, attr)
 
         new_class.add_to_class('series', InfluxQuerySet())
+        # must be added last as it compiles the encoder from the fields of the class.
+        new_class.add_to_class('_encoder', LineProtocolEncoder())
 
         return new_class
 
@@ -78,6 +99,7 @@ class InfluxMeasurement(metaclass=InfluxMeasurementBase):
     time = InfluxTimeField()
     series = None  # type: InfluxQuerySet
     _meta = None  # type: Options
+    _encoder = None  # type: LineProtocolEncoder
 
     def __init__(self, **kwargs):
         if self.measurement is None:
@@ -93,6 +115,26 @@ class InfluxMeasurement(metaclass=InfluxMeasurementBase):
                 raise RuntimeError('Only fields and tags can be set through __init__.')
             setattr(self, field.name, value)
 
+    @classmethod
+    def from_db(cls, columns: List[str], values: List, tags: dict = None) -> 'InfluxMeasurement':
+        """
+        Builds an instance from a row returned by influxdb, without the checks done by __init__
+        as rows may hold annotations.
+        :param columns: the columns of the series
+        :param values: the row values
+        :param tags: the tags of the series
+        :return: the instance
+        """
+        instance = cls.__new__(cls)
+        if tags:
+            for key, value in tags.items():
+                setattr(instance, key, value)
+        for column, value in zip(columns, values):
+            setattr(instance, column, value)
+        if getattr(instance, 'time', None) is not None:
+            instance.time = cls._meta.all_fields['time'].python_value(instance.time)
+        return instance
+
     def get_tags_and_fields(self):
         """
         Gets the tags and fields from _meta
@@ -109,20 +151,77 @@ class InfluxMeasurement(metaclass=InfluxMeasurementBase):
 
         return tags, fields
 
-    def save(self):
+    def get_point(self):
         """
-        Sends the data point to influxdb using the client_wrapper.
-        :return: None
+        Gets the point as expected by InfluxDBClient.write_points
+        :return: Dict
         """
         tags, fields = self.get_tags_and_fields()
-        data = [{
+        return {
             'measurement': self.measurement,
             'tags': tags,
             'time': self._meta.all_fields['time'].db_value(self.time),
             'fields': fields
-        }]
+        }
+
+    def save(self, using: str = None):
+        """
+        Sends the data point to influxdb using the client_wrapper,
+        the point is only queued when client_wrapper buffering is enabled (default database only).
+        :param using: alias of the database to write to
+        :return: None
+        """
+        line = self._encoder.encode(self)
+        if client_wrapper.buffer is not None and using is None:
+            client_wrapper.buffer.put(line)
+        else:
+            client_wrapper.write_lines(join_lines([line]), using=using)
+
+    async def asave(self, using: str = None):
+        """
+        Sends the data point to influxdb using the async_client_wrapper.
+        :param using: alias of the database to write to
+        :return: None
+        """
+        await async_client_wrapper.write_lines(join_lines([self._encoder.encode(self)]), using=using)
 
-        client = client_wrapper.write_points(data)
+    @classmethod
+    def bulk_save(cls,
+                  instances: Iterable['InfluxMeasurement'],
+                  batch_size: int = 5000,
+                  using: str = None) -> List[BatchReport]:
+        """
+        Sends many data points to influxdb, batch_size points per request.
+
+        A failing batch does not stop the following ones, its error is reported instead.
+        :param instances: the measurements to save
+        :param batch_size: maximum number of points sent in one request
+        :param using: alias of the database to write to
+        :return: a BatchReport (index, size, duration in seconds, error, TransferStats) per batch
+        """
+        if batch_size < 1:
+            raise ValueError('batch_size must be a positive integer.')
+
+        lines = [instance._encoder.encode(instance) for instance in instances]
+        reports = []
+
+        for index, start in enumerate(range(0, len(lines), batch_size)):
+            batch = lines[start:start + batch_size]
+            error = transfer = None
+            started = time.perf_counter()
+            try:
+                transfer = client_wrapper.write_lines(join_lines(batch), using=using)
+            except (InfluxDBClientError, InfluxDBServerError, requests.exceptions.RequestException) as e:
+                logger.error('Batch {index} of {size} points failed: {error}'.format(
+                    index=index, size=len(batch), error=e))
+                error = e
+            reports.append(BatchReport(index=index,
+                                       size=len(batch),
+                                       duration=time.perf_counter() - started,
+                                       error=error,
+                                       transfer=transfer))
+
+        return reports
 
 
 class ContinuousQuery(object):
@@ -134,8 +233,9 @@ class ContinuousQuery(object):
                  queryset: InfluxQuerySet,
                  name: str,
                  source: str,
-                 resample_every: BaseDuration,
+                 resample_every: BaseDuration = None,
                  resample_for: BaseDuration = None):
+        self.queryset = queryset
         self.query = queryset.iql_query()
         self.name = name
         self.resample_every = resample_every
@@ -148,10 +248,13 @@ class ContinuousQuery(object):
             '"{name}"'.format(name=self.name),
             'ON',
             self.source,
-            'RESAMPLE EVERY',
-            self.resample_every.as_iql()
         ]
 
+        if self.resample_every or self.resample_for:
+            parts.append('RESAMPLE')
+        if self.resample_every:
+            parts.append('EVERY')
+            parts.append(self.resample_every.as_iql())
         if self.resample_for:
             parts.append('FOR')
             parts.append(self.resample_for.as_iql())
@@ -162,7 +265,8 @@ class ContinuousQuery(object):
 
         return ' '.join(parts)
 
-    def save(self, force=False):
+    def save(self, force=False, using=None):
         if force:
-            client_wrapper.query('DROP CONTINUOUS QUERY {name}')
-        client_wrapper.query(self.iql_query())
+            client_wrapper.query('DROP CONTINUOUS QUERY "{name}" ON {source}'.format(name=self.name, source=self.source),
+                                 using=using)
+        client_wrapper.query(self.iql_query(), using=using)
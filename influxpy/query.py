@@ -1,19 +1,154 @@
-import copy
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
 
 
-class InfluxQuery(object):
-    def __init__(self):
-        self.resolution = None
-        self.group_by = []
-        self.filters = OrderedDict()
-        self.destination = None
-        self.fill = None
-        self.annotations = []
-        self.can_use_aggregated_measurement = False
+class InfluxFilters(tuple):
+    """Immutable ordered mapping of lookups (e.g. time__gte) to their values."""
+    __slots__ = ()
+
+    def __new__(cls, items=()):
+        if hasattr(items, 'items'):
+            items = items.items()
+        return super().__new__(cls, tuple(items))
+
+    def keys(self):
+        return [key for key, _ in self]
+
+    def values(self):
+        return [value for _, value in self]
+
+    def items(self):
+        return iter(self)
+
+    def get(self, key, default=None):
+        for k, value in self:
+            if k == key:
+                return value
+        return default
+
+    def update(self, items) -> 'InfluxFilters':
+        """Returns new filters where items replace or are appended to the existing ones."""
+        merged = OrderedDict(self.items())
+        merged.update(items)
+        return InfluxFilters(merged)
+
+    def remove(self, *keys: str) -> 'InfluxFilters':
+        return InfluxFilters((key, value) for key, value in self if key not in keys)
+
+
+TIME_LOOKUPS = ('time__between', 'time__gt', 'time__gte', 'time__lt', 'time__lte')
+
+TimeSplit = namedtuple('TimeSplit', ['chunk', 'max_points_per_chunk', 'max_workers'])
+
+
+class InfluxQuery(namedtuple('InfluxQuery', [
+    'resolution',
+    'group_by',
+    'filters',
+    'destination',
+    'fill',
+    'annotations',
+    'can_use_aggregated_measurement',
+    'database',
+    'cache_ttl',
+    'time_split',
+    'max_points',
+    'mean_of_means',
+    'descending',
+    'limit',
+    'offset',
+    'series_limit',
+    'series_offset',
+    'projection',
+    'response_format',
+])):
+    """
+    Immutable description of a query.
+
+    Chained query set calls build a new query with replace(), unchanged parts being shared
+    with the previous query, which makes cloning cheap and queries hashable.
+    """
+    __slots__ = ()
+
+    def __new__(cls,
+                resolution=None,
+                group_by=(),
+                filters=(),
+                destination=None,
+                fill=None,
+                annotations=(),
+                can_use_aggregated_measurement=False,
+                database=None,
+                cache_ttl=None,
+                time_split=None,
+                max_points=None,
+                mean_of_means=False,
+                descending=False,
+                limit=None,
+                offset=None,
+                series_limit=None,
+                series_offset=None,
+                projection=(),
+                response_format=None):
+        if not isinstance(filters, InfluxFilters):
+            filters = InfluxFilters(filters)
+        # tuple() returns tuples as is, so parts are shared between queries.
+        return super().__new__(cls,
+                               resolution,
+                               tuple(group_by),
+                               filters,
+                               destination,
+                               fill,
+                               tuple(annotations),
+                               can_use_aggregated_measurement,
+                               database,
+                               cache_ttl,
+                               time_split,
+                               max_points,
+                               mean_of_means,
+                               descending,
+                               limit,
+                               offset,
+                               series_limit,
+                               series_offset,
+                               tuple(projection),
+                               response_format)
+
+    def replace(self, **kwargs) -> 'InfluxQuery':
+        values = dict(zip(self._fields, self))
+        values.update(kwargs)
+        return InfluxQuery(**values)
+
+    def time_filters(self) -> tuple:
+        """
+        Returns the (key, value) of the lower and upper time filters, None when unbounded.
+        """
+        lower = upper = None
+        for key, value in self.filters.items():
+            if key == 'time__between':
+                lower, upper = ('time__gte', value[0]), ('time__lte', value[1])
+            elif key in ('time__gt', 'time__gte'):
+                lower = (key, value)
+            elif key in ('time__lt', 'time__lte'):
+                upper = (key, value)
+        return lower, upper
+
+    def time_bounds(self) -> tuple:
+        """
+        Returns the (lower, upper) time bounds set by the time filters, None when unbounded.
+        """
+        lower, upper = self.time_filters()
+        return lower and lower[1], upper and upper[1]
+
+    def is_sliced(self) -> bool:
+        """Tells whether the server only returns part of the points or series."""
+        return any(value is not None for value in (self.limit, self.offset, self.series_limit, self.series_offset))
+
+    def is_empty(self) -> bool:
+        """Tells whether the query returns nothing, e.g. after an empty slice, influxdb ignoring LIMIT 0."""
+        return self.limit == 0 or self.series_limit == 0
+
+    def __copy__(self):
+        return self
 
     def __deepcopy__(self, memo):
-        obj = self.__class__()
-        for k, v in self.__dict__.items():
-            obj.__dict__[k] = copy.deepcopy(v, memo=memo)
-        return obj
+        return self
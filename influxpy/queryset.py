@@ -1,14 +1,23 @@
+import asyncio
 import copy
+import datetime
+import functools
+import time
 from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List
 
 from influxdb.resultset import ResultSet
 
+from influxpy.aio import async_client_wrapper
+from influxpy.cache import CacheEntry, FINAL, copy_series, merge_refreshed, result_cache
 from influxpy.client import client_wrapper
+from influxpy.columns import InfluxColumns, columns_from_raw
 from influxpy.compiler import InfluxCompiler
-from influxpy.aggregates import BaseAggregate
-from influxpy.fields import BaseDuration
-from influxpy.query import InfluxQuery
+from influxpy.decoders import CONTENT_TYPES
+from influxpy.aggregates import Aggregate, BaseAggregate, Transformation
+from influxpy.fields import BaseDuration, InfluxTimeField
+from influxpy.query import InfluxQuery, TIME_LOOKUPS, TimeSplit
 
 
 class InfluxSeries(namedtuple('InfluxResult', ['points', 'tags'])):
@@ -16,6 +25,12 @@ class InfluxSeries(namedtuple('InfluxResult', ['points', 'tags'])):
         return self.points == other.points and self.tags == other.tags
 
 
+@functools.lru_cache(maxsize=256)
+def row_class(columns: tuple):
+    """Returns a namedtuple class (which has empty __slots__) for the given columns."""
+    return namedtuple('InfluxRow', columns, rename=True)
+
+
 class InfluxQuerySet(object):
     """Represent a lazy database lookup."""
 
@@ -24,12 +39,9 @@ class InfluxQuerySet(object):
         self.compiler = None  # type: InfluxCompiler
         self.model = None
 
-    def _fetch_results(self):  # -> List[InfluxResult]:
-        influx_query = self.compiler.compile(self.query)
-        result_set = client_wrapper.query(influx_query)  # type: ResultSet
-        results = []
-        series = result_set.raw.get('series', [])
-        for serie in series:
+    @staticmethod
+    def _series_from_raw(raw: dict):
+        for serie in raw.get('series', []):
 
             columns = serie['columns']
             tags = serie.get('tags')
@@ -42,16 +54,251 @@ class InfluxQuerySet(object):
 
             yield InfluxSeries(points=points, tags=tags)
 
+    @staticmethod
+    def _rows_from_raw(raw: dict, named: bool = False):
+        for serie in raw.get('series', []):
+            values = serie.get('values') or []
+            if named:
+                make_row = row_class(tuple(serie['columns']))._make
+                points = [make_row(value) for value in values]
+            else:
+                points = [tuple(value) for value in values]
+
+            yield InfluxSeries(points=points, tags=serie.get('tags'))
+
+    def _fetch_results(self):  # -> List[InfluxResult]:
+        if self.query.is_empty():
+            return
+
+        if self.query.time_split is not None:
+            yield from self._fetch_split_results()
+            return
+
+        if self.query.cache_ttl is not None:
+            yield from self._fetch_cached_results()
+            return
+
+        yield from self._fetch_uncached_results()
+
+    def _query_raw(self, epoch: str = None) -> dict:
+        """Sends the query, returns the raw result of its statement, empty when the server returned none."""
+        if self.query.is_empty():
+            return {}
+        results = client_wrapper.query_raw(self.compiler.compile(self.query), epoch=epoch, using=self.query.database,
+                                           response_format=self.query.response_format)
+        return results[0] if results else {}
+
+    def _fetch_uncached_results(self):
+        yield from self._series_from_raw(self._query_raw())
+
+    def _split_querysets(self) -> List['InfluxQuerySet']:
+        """
+        Splits the query on time boundaries, aligned on the resolution when there is one.
+        """
+        split = self.query.time_split
+        if self.query.is_sliced() or self.query.descending:
+            raise RuntimeError('Splitting a query cannot be combined with ordering or slicing.')
+        lower, upper = self.query.time_filters()
+        if lower is None or upper is None:
+            raise RuntimeError('Splitting a query needs both a lower and an upper time bound.')
+        aggregates = [annotation for annotation in self.query.annotations if isinstance(annotation, Aggregate)]
+        if aggregates and not isinstance(self.query.resolution, BaseDuration):
+            # each chunk would be aggregated over its own time range.
+            raise RuntimeError('Splitting an aggregated query needs a resolution.')
+        if any(isinstance(annotation, Transformation) for annotation in aggregates):
+            # the first values of each chunk would lack the points of the previous one.
+            raise RuntimeError('Splitting a query cannot be combined with transformations.')
+
+        if split.chunk is not None:
+            step = split.chunk.total_seconds()
+        elif isinstance(self.query.resolution, BaseDuration):
+            step = self.query.resolution.total_seconds() * split.max_points_per_chunk
+        else:
+            raise RuntimeError('Splitting a query needs a chunk duration or a resolution.')
+
+        if isinstance(self.query.resolution, BaseDuration):
+            # chunks must not cut through a time bucket.
+            resolution = self.query.resolution.total_seconds()
+            step = max(step // resolution, 1) * resolution
+
+        start = InfluxTimeField.epoch_value(lower[1]) // 1000000000
+        end = InfluxTimeField.epoch_value(upper[1]) // 1000000000
+        boundaries = range((start // step + 1) * step, end, step)
+
+        lower_filters = [lower] + [('time__gte', boundary) for boundary in boundaries]
+        upper_filters = [('time__lt', boundary) for boundary in boundaries] + [upper]
+
+        filters = self.query.filters.remove(*TIME_LOOKUPS)
+        querysets = []
+        for (lower_key, lower_value), (upper_key, upper_value) in zip(lower_filters, upper_filters):
+            if isinstance(lower_value, int):
+                lower_value = datetime.datetime(1970, 1, 1) + datetime.timedelta(seconds=lower_value)
+            if isinstance(upper_value, int):
+                upper_value = datetime.datetime(1970, 1, 1) + datetime.timedelta(seconds=upper_value)
+            clone = self.clone()
+            clone.query = clone.query.replace(
+                filters=filters.update([(lower_key, lower_value), (upper_key, upper_value)]),
+                time_split=None)
+            querysets.append(clone)
+        return querysets
+
+    def _fetch_split_results(self) -> List[InfluxSeries]:
+        querysets = self._split_querysets()
+        with ThreadPoolExecutor(max_workers=self.query.time_split.max_workers) as executor:
+            chunks = list(executor.map(list, querysets))
+
+        stitched = OrderedDict()
+        for chunk in chunks:
+            for serie in chunk:
+                key = tuple(sorted((serie.tags or {}).items()))
+                if key in stitched:
+                    stitched[key].points.extend(serie.points)
+                else:
+                    stitched[key] = InfluxSeries(points=list(serie.points), tags=serie.tags)
+        return list(stitched.values())
+
+    def _refresh_from(self, now: float):
+        """
+        Start (epoch in seconds) of the first time bucket which can still change,
+        FINAL when every bucket is closed, None without resolution or when the refreshed
+        points could not simply be appended (ordering, slicing).
+        """
+        if not isinstance(self.query.resolution, BaseDuration) or self.query.is_sliced() or self.query.descending:
+            return None
+
+        step = self.query.resolution.total_seconds()
+        open_bucket = int(now // step * step)
+        _, upper = self.query.time_bounds()
+        if upper is not None and InfluxTimeField.epoch_value(upper) // 1000000000 < open_bucket:
+            return FINAL
+        return open_bucket
+
+    def _fetch_cached_results(self) -> List[InfluxSeries]:
+        key = (client_wrapper.get_database(self.query.database), self.compiler.compile(self.query))
+        entry = result_cache.get(key)
+
+        if entry is not None and result_cache.is_fresh(entry, self.query.cache_ttl):
+            result_cache.record(hit=True)
+            return copy_series(entry.series)
+
+        now = time.time()
+        series = None
+
+        if entry is not None and entry.refresh_from is not None:
+            lower, _ = self.query.time_bounds()
+            if lower is None or InfluxTimeField.epoch_value(lower) // 1000000000 <= entry.refresh_from:
+                # closed buckets never change, only the ones open at the previous fetch are queried.
+                refresh_from = datetime.datetime(1970, 1, 1) + datetime.timedelta(seconds=entry.refresh_from)
+                fresh = list(self.filter(time__gte=refresh_from)._fetch_uncached_results())
+                series = merge_refreshed(entry.series, fresh, entry.refresh_from)
+                result_cache.record(partial=True)
+
+        if series is None:
+            series = list(self._fetch_uncached_results())
+            result_cache.record()
+
+        result_cache.set(key, CacheEntry(series=series, fetched_at=now, refresh_from=self._refresh_from(now)))
+        return copy_series(series)
+
+    async def _afetch_results(self):
+        if self.query.is_empty():
+            return
+
+        if self.query.time_split is not None or self.query.cache_ttl is not None:
+            # the result cache and split queries are synchronous, they run in a thread.
+            series = await asyncio.get_running_loop().run_in_executor(None, list, self._fetch_results())
+            for serie in series:
+                yield serie
+            return
+
+        results = await async_client_wrapper.query_raw(self.compiler.compile(self.query),
+                                                       using=self.query.database,
+                                                       response_format=self.query.response_format)
+        for serie in self._series_from_raw(results[0] if results else {}):
+            yield serie
+
+    def iterator(self, chunk_size: int = 10000):
+        """
+        Streams the results using influxdb chunked responses, memory use is bounded by chunk_size.
+
+        Each yielded InfluxSeries holds at most chunk_size points, so a series may be split
+        over several consecutive InfluxSeries sharing the same tags.
+        :param chunk_size: maximum number of points per chunk
+        """
+        if self.query.is_empty():
+            return
+
+        influx_query = self.compiler.compile(self.query)
+        for result in client_wrapper.query_chunked(influx_query, chunk_size=chunk_size,
+                                                   using=self.query.database):
+            yield from self._series_from_raw(result)
+
+    def values_list(self, named: bool = False):
+        """
+        Yields InfluxSeries whose points are tuples ordered as the series columns instead of dicts.
+        :param named: when True points are namedtuples built from the columns
+        """
+        yield from self._rows_from_raw(self._query_raw(), named=named)
+
+    def instances(self):
+        """
+        Yields model instances lazily built from the returned rows, series tags being set on each instance.
+        """
+        for serie in self._query_raw().get('series', []):
+            columns = serie['columns']
+            tags = serie.get('tags')
+            for value in serie.get('values') or []:
+                yield self.model.from_db(columns, value, tags)
+
+    def to_columns(self, epoch: str = 'ns') -> List[InfluxColumns]:
+        """
+        Fetches the results column-wise, skipping the creation of a dict per point.
+
+        Columns are numpy arrays when numpy is installed, array.array (or lists for non numeric
+        columns) otherwise. The time column holds int64 timestamps.
+        :param epoch: precision of the timestamps, one of 'h', 'm', 's', 'ms', 'u' or 'ns'
+        """
+        return columns_from_raw(self._query_raw(epoch=epoch))
+
     def __iter__(self):
         return iter(self._fetch_results())
 
+    def __getitem__(self, k: slice) -> 'InfluxQuerySet':
+        """
+        Returns a query set limited to the k points of each series, sent as LIMIT and OFFSET.
+        :param k: a slice without step, e.g. qs[100:200]
+        """
+        if not isinstance(k, slice):
+            raise TypeError('Query sets only support slices, e.g. qs[:100].')
+        if k.step is not None:
+            raise ValueError('Query set slices cannot have a step.')
+        if (k.start is not None and k.start < 0) or (k.stop is not None and k.stop < 0):
+            raise ValueError('Negative indexing is not supported.')
+
+        # slices of a sliced query set are relative to it.
+        offset = self.query.offset or 0
+        start = offset + (k.start or 0)
+        stop = None if k.stop is None else offset + k.stop
+        if self.query.limit is not None:
+            end = offset + self.query.limit
+            start = min(start, end)
+            stop = end if stop is None else min(stop, end)
+
+        clone = self.clone()
+        clone.query = clone.query.replace(offset=start or None,
+                                          limit=None if stop is None else max(stop - start, 0))
+        return clone
+
+    def __aiter__(self):
+        return self._afetch_results()
+
     def iql_query(self) -> str:
         """Returns the Influx query"""
         return self.compiler.compile(self.query)
 
     def using(self, database_alias: str) -> 'InfluxQuerySet':
         clone = self.clone()
-        clone.query.database = database_alias
+        clone.query = clone.query.replace(database=database_alias)
         return clone
 
     def filter(self, **kwargs) -> 'InfluxQuerySet':
@@ -61,7 +308,7 @@ class InfluxQuerySet(object):
         """
         clone = self.clone()
         ordered_kwargs = OrderedDict(sorted(kwargs.items(), key=lambda t: t[0]))
-        clone.query.filters.update(ordered_kwargs)
+        clone.query = clone.query.replace(filters=clone.query.filters.update(ordered_kwargs))
         return clone
 
     def all(self) -> 'InfluxQuerySet':
@@ -79,7 +326,7 @@ class InfluxQuerySet(object):
         :return:
         """
         clone = self.clone()
-        clone.query.group_by = clone.query.group_by + list(args)
+        clone.query = clone.query.replace(group_by=clone.query.group_by + args)
         return clone
 
     def into(self, destination) -> 'InfluxQuerySet':
@@ -89,7 +336,7 @@ class InfluxQuerySet(object):
         :return:
         """
         clone = self.clone()
-        clone.query.destination = destination
+        clone.query = clone.query.replace(destination=destination)
         return clone
 
     def resolution(self, resolution: BaseDuration) -> 'InfluxQuerySet':
@@ -99,7 +346,7 @@ class InfluxQuerySet(object):
         :return:
         """
         clone = self.clone()
-        clone.query.resolution = resolution
+        clone.query = clone.query.replace(resolution=resolution)
         return clone
 
     def fill(self, value) -> 'InfluxQuerySet':
@@ -108,7 +355,7 @@ class InfluxQuerySet(object):
         :param value:
         """
         clone = self.clone()
-        clone.query.fill = value
+        clone.query = clone.query.replace(fill=value)
         return clone
 
     def annotate(self, *args: BaseAggregate, **kwargs: BaseAggregate) -> 'InfluxQuerySet':
@@ -117,27 +364,131 @@ class InfluxQuerySet(object):
         with extra data or aggregations.
         """
         clone = self.clone()
-        for annotation in args:
-            clone.query.annotations.append(annotation)
+        annotations = list(args)
 
         for name, annotation in kwargs.items():
+            # aggregates are shared between queries, the named one is a copy.
+            annotation = copy.copy(annotation)
             annotation.name = name
-            clone.query.annotations.append(annotation)
+            annotations.append(annotation)
+
+        clone.query = clone.query.replace(annotations=clone.query.annotations + tuple(annotations))
+        return clone
+
+    def only(self, *names: str) -> 'InfluxQuerySet':
+        """
+        Returns a query set selecting only the given fields and tags instead of *, time is always returned.
+        :param names: the fields and tags, replacing the ones of a previous call
+        """
+        clone = self.clone()
+        clone.query = clone.query.replace(projection=tuple(name for name in names if name != 'time'))
+        return clone
+
+    def values(self, *names: str) -> 'InfluxQuerySet':
+        """Same as only(), points being dicts of the selected columns."""
+        return self.only(*names)
+
+    def response_format(self, response_format: str) -> 'InfluxQuerySet':
+        """
+        Returns a query set asking influxdb for another response format, cheaper to parse for large results.
+        :param response_format: 'json', 'csv' (loses the types of numbers) or 'msgpack' (needs msgpack)
+        """
+        if response_format not in CONTENT_TYPES:
+            raise ValueError('Unknown response format "{}".'.format(response_format))
+        clone = self.clone()
+        clone.query = clone.query.replace(response_format=response_format)
+        return clone
+
+    def order_by(self, field: str) -> 'InfluxQuerySet':
+        """
+        Returns a query set ordered by time, influxdb cannot order by anything else.
+        :param field: 'time' or '-time' for the newest points first
+        """
+        if field not in ('time', '-time'):
+            raise RuntimeError('Query sets can only be ordered by "time" or "-time".')
+        if self.query.limit is not None or self.query.offset is not None:
+            raise RuntimeError('Cannot reorder a sliced query set.')
+        clone = self.clone()
+        clone.query = clone.query.replace(descending=field == '-time')
+        return clone
+
+    def first(self) -> List[InfluxSeries]:
+        """
+        Returns the series holding only their first point, the oldest one unless ordered by -time.
+        """
+        return list(self[:1])
 
+    def last(self) -> List[InfluxSeries]:
+        """
+        Returns the series holding only their last point, the newest one unless ordered by -time.
+        """
+        if self.query.is_empty():
+            # sliced query sets cannot be reordered, an empty one has no last point anyway.
+            return []
+        return list(self.order_by('time' if self.query.descending else '-time')[:1])
+
+    def series_limit(self, limit: int, offset: int = None) -> 'InfluxQuerySet':
+        """
+        Returns a query set returning at most limit series, sent as SLIMIT and SOFFSET.
+        :param limit: the maximum number of series
+        :param offset: the number of series skipped
+        """
+        clone = self.clone()
+        clone.query = clone.query.replace(series_limit=limit, series_offset=offset)
+        return clone
+
+    def split_time(self,
+                   chunk: BaseDuration = None,
+                   max_points_per_chunk: int = 10000,
+                   max_workers: int = 4) -> 'InfluxQuerySet':
+        """
+        Returns a query set whose time range is fetched as several queries sent concurrently,
+        the series of each chunk being stitched back in order.
+
+        Each chunk covers the chunk duration, or max_points_per_chunk times the resolution when
+        chunk is None, and chunks are aligned on the resolution so no time bucket is split.
+        Aggregates need a resolution and transformations cannot be split.
+        :param chunk: the duration of each chunk
+        :param max_points_per_chunk: points per series and per chunk when chunk is None
+        :param max_workers: maximum number of queries in flight
+        """
+        clone = self.clone()
+        clone.query = clone.query.replace(time_split=TimeSplit(chunk=chunk,
+                                                               max_points_per_chunk=max_points_per_chunk,
+                                                               max_workers=max_workers))
+        return clone
+
+    def cache(self, ttl: float = None) -> 'InfluxQuerySet':
+        """
+        Returns a query set whose results are kept in influxpy.cache.result_cache.
+
+        With a resolution, closed time buckets are kept until evicted and only the buckets
+        which were still open are refetched once ttl expired.
+        :param ttl: seconds before refetching, defaults to result_cache.ttl
+        """
+        clone = self.clone()
+        clone.query = clone.query.replace(cache_ttl=result_cache.ttl if ttl is None else ttl)
         return clone
 
-    def use_downsampled(self) -> 'InfluxQuerySet':
+    def use_downsampled(self, max_points: int = None, mean_of_means: bool = False) -> 'InfluxQuerySet':
         """
-        Returns a query set but can use downsampled tables
+        Returns a query set but can use downsampled tables, see InfluxCompiler.plan
+        :param max_points: without resolution, picks the downsampled table returning at most
+            max_points points per series over the filtered time range.
+        :param mean_of_means: lets Mean read the mean of downsampled means, which is wrong whenever
+            the downsampled buckets hold different numbers of points (gaps, partial buckets).
         :return:
         """
         clone = self.clone()
-        clone.query.can_use_aggregated_measurement = True
+        clone.query = clone.query.replace(can_use_aggregated_measurement=True,
+                                          max_points=max_points,
+                                          mean_of_means=mean_of_means)
         return clone
 
     def clone(self) -> 'InfluxQuerySet':
         clone = InfluxQuerySet()
-        clone.query = copy.deepcopy(self.query)
+        # queries are immutable, they can be shared.
+        clone.query = self.query
         clone.model = self.model
         clone.compiler = self.compiler
         return clone
@@ -70,7 +70,10 @@ setup(
     # for example:
     # $ pip install -e .[dev,test]
     extras_require={
+        'async': ['aiohttp'],
         'docs': ['sphinx', 'sphinx_rtd_theme'],
+        'msgpack': ['msgpack'],
+        'numpy': ['numpy'],
         'test': ['coverage'],
     },
 )
@@ -0,0 +1,102 @@
+from datetime import datetime
+from unittest import TestCase, mock, skipIf
+
+from influxpy import aggregates, local
+from influxpy.aggregates import Count, Derivative, First, Last, Max, Mean, Median, Min, MovingAverage, \
+    NonNegativeDerivative, Percentile, Spread, Stddev, Sum, Transformation
+from influxpy.fields import InfluxField, InfluxTag, Hours, Minutes
+from influxpy.local import aggregate
+from influxpy.model import InfluxMeasurement
+from influxpy.queryset import InfluxSeries
+
+
+class DiskMeasurement(InfluxMeasurement):
+    measurement = 'disk'
+
+    used = InfluxField()
+    host = InfluxTag()
+
+
+VALUES = [7, None, 1, 4, 9, 4, 2.5]
+
+SERIES = [InfluxSeries(points=[{'time': '2017-12-12T09:0{}:00Z'.format(minute), 'used': value}
+                               for minute, value in enumerate(VALUES)], tags={'host': 'a'})]
+
+
+class AggregatesTest(TestCase):
+    def test_compile(self):
+        qs = DiskMeasurement.series.filter(time__gte=datetime(2017, 12, 12)).resolution(Hours(1)).annotate(
+            Count('used'), Percentile('used', 95), Spread('used'), rate=NonNegativeDerivative(Max('used'), Minutes(1)),
+            smooth=MovingAverage(Mean('used'), 3))
+
+        self.assertEqual(
+            qs.iql_query(),
+            'SELECT count(used), percentile(used, 95), spread(used), non_negative_derivative(max(used), 1m) AS "rate", '
+            'moving_average(mean(used), 3) AS "smooth" FROM disk WHERE "time" >= \'2017-12-12T00:00:00Z\' '
+            'GROUP BY time(1h)')
+
+    def test_unknown_field(self):
+        with self.assertRaises(RuntimeError):
+            DiskMeasurement.series.annotate(Median('free')).iql_query()
+        with self.assertRaises(RuntimeError):
+            DiskMeasurement.series.annotate(Min('host')).iql_query()
+        with self.assertRaises(ValueError):
+            Percentile('used', 101)
+
+    def evaluate_all(self):
+        return [aggregate(SERIES, aggregate_)[0].points[0][aggregate_.column] for aggregate_ in [
+            Count('used'), Sum('used'), Mean('used'), Min('used'), Max('used'), Median('used'),
+            Percentile('used', 50), Spread('used'), First('used'), Last('used'),
+        ]] + [aggregate(SERIES, Stddev('used'))[0].points[0]['stddev']]
+
+    @skipIf(aggregates.numpy is None, 'numpy is not installed')
+    def test_evaluate_numpy_and_python(self):
+        expected = [6, 27.5, 27.5 / 6, 1, 9, 4, 4, 8, 7, 2.5]
+        evaluated = self.evaluate_all()
+        with mock.patch.object(local, 'numpy', None), mock.patch.object(aggregates, 'numpy', None):
+            fallback = self.evaluate_all()
+
+        self.assertEqual(evaluated[:-1], expected)
+        self.assertEqual(fallback[:-1], expected)
+        self.assertAlmostEqual(evaluated[-1], fallback[-1])
+        self.assertIsNone(Stddev('used').evaluate([3]))
+
+    def test_transform(self):
+        times = [0, 60, 120, 180]
+        values = [10, 40, None, 20]
+
+        for numpy in [aggregates.numpy, None]:
+            with mock.patch.object(aggregates, 'numpy', numpy):
+                self.assertEqual(Derivative('used', Minutes(1)).transform(times, values, precision=1000000000),
+                                 [None, 30.0, None, None])
+                self.assertEqual(NonNegativeDerivative('used').transform(times, [10, 40, 20, 50], 1000000000),
+                                 [None, 0.5, None, 0.5])
+                self.assertEqual(MovingAverage('used', 2).transform(times, [10, 40, 20, 50]),
+                                 [None, 25.0, 30.0, 35.0])
+
+    def test_transform_short_series(self):
+        transformations = [Derivative('used'), NonNegativeDerivative('used'), MovingAverage('used', 3)]
+
+        for numpy in [aggregates.numpy, None]:
+            with mock.patch.object(aggregates, 'numpy', numpy):
+                for transformation in transformations:
+                    self.assertEqual(transformation.transform([], []), [])
+                    self.assertEqual(transformation.transform([0], [10]), [None])
+                self.assertEqual(MovingAverage('used', 3).transform([0, 60], [10, 40]), [None, None])
+                self.assertEqual(MovingAverage('used', 3).transform([0, 60, 120], [10, 40, 40]), [None, None, 30.0])
+
+    def test_transform_not_implemented(self):
+        class Difference(Transformation):
+            func = 'difference'
+
+        for numpy in [aggregates.numpy, None]:
+            with mock.patch.object(aggregates, 'numpy', numpy):
+                with self.assertRaises(RuntimeError):
+                    Difference('used').transform([0, 60], [10, 40])
+
+    def test_transform_buckets(self):
+        rates = aggregate(SERIES, Derivative(Max('used'), Minutes(1)), resolution=Minutes(2))[0].points
+
+        self.assertEqual([point['derivative'] for point in rates], [None, -1.5, 2.5, -3.25])
+        with self.assertRaises(RuntimeError):
+            aggregate(SERIES, Derivative('used'))
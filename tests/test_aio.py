@@ -0,0 +1,143 @@
+import asyncio
+from datetime import datetime
+from unittest import TestCase, mock, skipIf
+
+from influxdb.exceptions import InfluxDBClientError
+
+from influxpy import aio
+from influxpy.aio import AsyncInfluxClientWrapper
+from influxpy.client import client_wrapper
+from influxpy.fields import InfluxField, InfluxTag
+from influxpy.model import InfluxMeasurement
+from tests.stub import StubInfluxServer
+from tests.test_client import unused_port
+
+
+class CpuMeasurement(InfluxMeasurement):
+    measurement = 'cpu'
+
+    value = InfluxField()
+    host = InfluxTag()
+
+
+CPU_RESPONSE = {'results': [{'statement_id': 0, 'series': [{
+    'name': 'cpu',
+    'tags': {'host': 'a'},
+    'columns': ['time', 'value'],
+    'values': [['2017-12-12T08:00:00Z', 1], ['2017-12-12T09:00:00Z', 2]]
+}]}]}
+
+
+@skipIf(aio.aiohttp is None, 'aiohttp is not installed')
+class AsyncClientTest(TestCase):
+    def run_with_wrapper(self, server, coroutine_function):
+        wrapper = AsyncInfluxClientWrapper(url=server.url)
+
+        async def run():
+            try:
+                return await coroutine_function()
+            finally:
+                await wrapper.close()
+
+        with mock.patch('influxpy.queryset.async_client_wrapper', wrapper), \
+                mock.patch('influxpy.model.async_client_wrapper', wrapper):
+            return asyncio.run(run())
+
+    def test_async_iteration(self):
+        qs = CpuMeasurement.series.group_by('host')
+
+        with StubInfluxServer({qs.iql_query(): CPU_RESPONSE}) as server:
+            async def collect():
+                return [serie async for serie in qs]
+
+            results = self.run_with_wrapper(server, collect)
+
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0].tags, {'host': 'a'})
+        self.assertEqual(results[0].points[1], {'time': '2017-12-12T09:00:00Z', 'value': 2})
+        self.assertEqual(server.queries[0]['db'], 'stub')
+
+    def test_concurrent_queries(self):
+        qs = CpuMeasurement.series.group_by('host')
+
+        with StubInfluxServer({qs.iql_query(): CPU_RESPONSE}) as server:
+            async def collect():
+                async def one():
+                    return [serie async for serie in qs]
+                return await asyncio.gather(*[one() for _ in range(50)])
+
+            results = self.run_with_wrapper(server, collect)
+
+        self.assertEqual(len(results), 50)
+        self.assertEqual(len(server.queries), 50)
+
+    def test_query_error(self):
+        qs = CpuMeasurement.series.all()
+
+        with StubInfluxServer({qs.iql_query(): {'results': [{'statement_id': 0, 'error': 'boom'}]}}) as server:
+            async def collect():
+                return [serie async for serie in qs]
+
+            with self.assertRaises(InfluxDBClientError):
+                self.run_with_wrapper(server, collect)
+
+    def test_asave(self):
+        point = CpuMeasurement(value=3, host='a', time=datetime(2017, 12, 12, 8))
+
+        with StubInfluxServer() as server:
+            self.run_with_wrapper(server, point.asave)
+
+        params, body, headers = server.writes[0]
+        self.assertEqual(params, {'db': 'stub', 'precision': 'n'})
+        self.assertEqual(body, b'cpu,host=a value=3i 1513065600000000000\n')
+
+    def test_using(self):
+        qs = CpuMeasurement.series.group_by('host').using('replica')
+        point = CpuMeasurement(value=3, host='a', time=datetime(2017, 12, 12, 8))
+
+        with StubInfluxServer({qs.iql_query(): CPU_RESPONSE}) as server, mock.patch.dict(client_wrapper.connections):
+            # the first host is down, requests fail over to the stub.
+            host, port = server.server.server_address
+            client_wrapper.register('replica', 'influxdb://root:root@{host}:{unused},{host}:{port}/replica'.format(
+                host=host, unused=unused_port(), port=port))
+
+            async def run():
+                results = [serie async for serie in qs]
+                await point.asave(using='replica')
+                return results
+
+            results = self.run_with_wrapper(server, run)
+
+        self.assertEqual(results[0].points[0], {'time': '2017-12-12T08:00:00Z', 'value': 1})
+        self.assertEqual(server.queries[0]['db'], 'replica')
+        self.assertEqual(server.writes[0][0]['db'], 'replica')
+
+    def test_cached(self):
+        qs = CpuMeasurement.series.group_by('host').filter(host='a').cache(ttl=60)
+
+        with StubInfluxServer({qs.iql_query(): CPU_RESPONSE}) as server, server.patch_client():
+            async def collect():
+                return [[serie async for serie in qs] for _ in range(2)]
+
+            first, second = self.run_with_wrapper(server, collect)
+
+        self.assertEqual(first, second)
+        self.assertEqual(len(server.queries), 1)
+
+    def test_sessions_closed_with_their_loop(self):
+        with StubInfluxServer() as server:
+            wrapper = AsyncInfluxClientWrapper(url=server.url)
+            connection = wrapper.get_connection()
+
+            async def session():
+                await wrapper.query('SHOW DATABASES')
+                return await wrapper.get_session(connection, connection.hosts[0])
+
+            first = asyncio.run(session())
+            second = asyncio.run(session())
+            asyncio.run(wrapper.close())
+
+        self.assertIsNot(first, second)
+        self.assertTrue(first.closed)
+        self.assertTrue(second.closed)
+        self.assertEqual(len(server.queries), 2)
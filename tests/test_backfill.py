@@ -0,0 +1,64 @@
+import os
+import tempfile
+from datetime import datetime
+from unittest import TestCase, mock
+
+from influxdb.exceptions import InfluxDBServerError
+
+from influxpy.aggregates import Sum
+from influxpy.backfill import backfill
+from influxpy.fields import InfluxField, InfluxTag, Hours
+from influxpy.model import ContinuousQuery, InfluxMeasurement
+
+
+class HitMeasurement(InfluxMeasurement):
+    measurement = 'hits'
+
+    count = InfluxField()
+    page = InfluxTag()
+
+
+class BackfillTest(TestCase):
+    def setUp(self):
+        qs = HitMeasurement.series.annotate(count=Sum('count')).resolution(Hours(1)).group_by('page').into('hits_hour')
+        self.cq = ContinuousQuery(queryset=qs, name='cq_hits_hour', source='influx')
+        self.checkpoint = os.path.join(tempfile.mkdtemp(), 'backfill.json')
+
+    def backfill(self, side_effect=None, **kwargs):
+        with mock.patch('influxpy.backfill.client_wrapper') as wrapper:
+            wrapper.query.side_effect = side_effect
+            reports = backfill(self.cq, datetime(2017, 12, 12), datetime(2017, 12, 13), chunk=Hours(6),
+                               checkpoint=self.checkpoint, **kwargs)
+        return reports, [call[0][0] for call in wrapper.query.call_args_list]
+
+    def test_chunks(self):
+        progress = []
+        reports, queries = self.backfill(progress=progress.append)
+
+        self.assertEqual(sorted(queries), [report.query for report in reports])
+        self.assertEqual(reports[0].query,
+                         "SELECT sum(count) AS \"count\" INTO hits_hour FROM hits "
+                         "WHERE \"time\" >= '2017-12-12T00:00:00Z' AND \"time\" < '2017-12-12T06:00:00Z' "
+                         "GROUP BY time(1h), \"page\"")
+        self.assertEqual(len(reports), 4)
+        self.assertEqual(progress[-1][:4], (4, 0, 0, 4))
+
+        self.assertEqual(self.backfill()[1], [])
+
+    def test_resume_failed_chunks(self):
+        def query(iql, using=None):
+            if "'2017-12-12T12:00:00Z' AND" in iql:
+                raise InfluxDBServerError('timeout')
+
+        reports, _ = self.backfill(side_effect=query)
+        self.assertEqual([report.index for report in reports if report.error], [2])
+
+        progress = []
+        reports, queries = self.backfill(progress=progress.append)
+        self.assertEqual([report.index for report in reports], [2])
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(progress[-1][:4], (1, 3, 0, 4))
+
+    def test_needs_destination(self):
+        with self.assertRaises(RuntimeError):
+            backfill(HitMeasurement.series, datetime(2017, 12, 12), datetime(2017, 12, 13))
@@ -0,0 +1,111 @@
+import threading
+import time
+from unittest import TestCase
+
+from influxpy.buffer import BufferedWriter
+
+
+class BufferedWriterTest(TestCase):
+    def setUp(self):
+        self.bodies = []
+
+    def write(self, body):
+        self.bodies.append(body)
+
+    def test_flush_on_batch_size(self):
+        writer = BufferedWriter(self.write, batch_size=2, max_latency=60)
+        for i in range(5):
+            writer.put('cpu value={}i'.format(i))
+        writer.flush(timeout=5)
+        writer.close()
+
+        self.assertEqual(self.bodies, [b'cpu value=0i\ncpu value=1i\n',
+                                       b'cpu value=2i\ncpu value=3i\n',
+                                       b'cpu value=4i\n'])
+        self.assertEqual(writer.metrics.written_points, 5)
+        self.assertEqual(writer.metrics.flushes, 3)
+
+    def test_flush_on_latency(self):
+        written = threading.Event()
+        writer = BufferedWriter(lambda body: written.set(), batch_size=100, max_latency=0.01)
+        writer.put('cpu value=1i')
+
+        self.assertTrue(written.wait(5))
+        writer.close()
+
+    def test_drops_when_full(self):
+        release = threading.Event()
+        writer = BufferedWriter(lambda body: release.wait(5), batch_size=1, max_queue_size=1, block=False)
+        results = [writer.put('cpu value={}i'.format(i)) for i in range(10)]
+        release.set()
+        writer.close()
+
+        self.assertIn(False, results)
+        self.assertEqual(writer.metrics.dropped_points, results.count(False))
+        self.assertEqual(writer.metrics.written_points, results.count(True))
+
+    def test_failed_flush(self):
+        def fail(body):
+            raise ConnectionError('down')
+
+        writer = BufferedWriter(fail, batch_size=2)
+        writer.put('cpu value=1i')
+        writer.close()
+
+        self.assertEqual(writer.metrics.failed_flushes, 1)
+        self.assertEqual(writer.metrics.dropped_points, 1)
+
+    def test_clone(self):
+        writer = BufferedWriter(self.write, batch_size=3, max_latency=60)
+        clone = writer.clone()
+        writer.close()
+        self.assertIsNone(clone._thread)
+        clone.put('cpu value=1i')
+        clone.close()
+
+        self.assertEqual(clone.batch_size, 3)
+        self.assertEqual(self.bodies, [b'cpu value=1i\n'])
+
+    def test_close_racing_with_put(self):
+        writer = BufferedWriter(self.write, batch_size=10, max_latency=60)
+        accepted = []
+
+        def produce(worker):
+            for i in range(200):
+                try:
+                    writer.put('cpu,worker={} value={}i'.format(worker, i))
+                except RuntimeError:
+                    return
+                accepted.append(i)
+
+        threads = [threading.Thread(target=produce, args=(worker,)) for worker in range(4)]
+        for thread in threads:
+            thread.start()
+        writer.close(timeout=5)
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sum(body.count(b'\n') for body in self.bodies), len(accepted))
+        with self.assertRaises(RuntimeError):
+            writer.put('cpu value=1i')
+
+    def test_flush_after_close(self):
+        writer = BufferedWriter(self.write)
+        writer.put('cpu value=1i')
+        writer.close()
+
+        self.assertFalse(writer.flush())
+        self.assertEqual(self.bodies, [b'cpu value=1i\n'])
+
+    def test_close_timeout_on_full_queue(self):
+        release = threading.Event()
+        writer = BufferedWriter(lambda body: release.wait(5), batch_size=1, max_queue_size=1, block=False)
+        writer.put('cpu value=1i')
+        writer.put('cpu value=2i')
+        writer.put('cpu value=3i')
+
+        started = time.monotonic()
+        self.assertFalse(writer.flush(timeout=0.1))
+        writer.close(timeout=0.1)
+        self.assertLess(time.monotonic() - started, 2)
+        release.set()
@@ -0,0 +1,113 @@
+from datetime import datetime
+from unittest import TestCase, mock
+
+from influxpy.cache import result_cache
+from influxpy.fields import InfluxField, InfluxTag, Hours
+from influxpy.model import InfluxMeasurement
+from influxpy.queryset import InfluxSeries
+
+
+class RequestsMeasurement(InfluxMeasurement):
+    measurement = 'requests'
+
+    count = InfluxField()
+    host = InfluxTag()
+
+
+def raw_result(*values):
+    return [{'statement_id': 0, 'series': [{
+        'name': 'requests', 'tags': {'host': 'a'}, 'columns': ['time', 'count'], 'values': list(values)}]}]
+
+
+# 2017-12-12T10:30:00Z
+NOW = 1513074600
+
+
+class ResultCacheTest(TestCase):
+    def setUp(self):
+        result_cache.clear()
+
+    def test_ttl(self):
+        qs = RequestsMeasurement.series.filter(host='a').cache(ttl=5)
+
+        with mock.patch('influxpy.queryset.client_wrapper') as wrapper, mock.patch('time.time') as now:
+            wrapper.query_raw.return_value = raw_result(['2017-12-12T10:00:00Z', 1])
+            now.return_value = NOW
+            list(qs)
+            list(qs)
+            now.return_value = NOW + 10
+            list(qs)
+
+        self.assertEqual(wrapper.query_raw.call_count, 2)
+        self.assertEqual(result_cache.stats().hits, 1)
+
+    def test_results_are_copies(self):
+        qs = RequestsMeasurement.series.filter(host='a').cache(ttl=5)
+
+        with mock.patch('influxpy.queryset.client_wrapper') as wrapper, mock.patch('time.time') as now:
+            wrapper.query_raw.return_value = raw_result(['2017-12-12T10:00:00Z', 1])
+            now.return_value = NOW
+            list(qs)[0].points.clear()
+            list(qs)[0].points.append({'time': '2017-12-12T11:00:00Z', 'count': 2})
+            results = list(qs)
+
+        self.assertEqual(results[0].points, [{'time': '2017-12-12T10:00:00Z', 'count': 1}])
+        self.assertEqual(wrapper.query_raw.call_count, 1)
+
+    def test_only_open_bucket_is_refetched(self):
+        qs = RequestsMeasurement.series.filter(
+            time__gte=datetime(2017, 12, 12, 8)).group_by('host').resolution(Hours(1)).cache(ttl=5)
+
+        with mock.patch('influxpy.queryset.client_wrapper') as wrapper, mock.patch('time.time') as now:
+            now.return_value = NOW
+            wrapper.query_raw.return_value = raw_result(['2017-12-12T08:00:00Z', 1],
+                                                    ['2017-12-12T09:00:00Z', 2],
+                                                    ['2017-12-12T10:00:00Z', 3])
+            list(qs)
+
+            now.return_value = NOW + 3600
+            wrapper.query_raw.return_value = raw_result(['2017-12-12T10:00:00Z', 4],
+                                                    ['2017-12-12T11:00:00Z', 5])
+            results = list(qs)
+
+        self.assertEqual(wrapper.query_raw.call_args[0][0],
+                         "SELECT * FROM requests WHERE \"time\" >= '2017-12-12T10:00:00Z' GROUP BY time(1h), \"host\"")
+        self.assertEqual(results, [InfluxSeries(points=[{'time': '2017-12-12T08:00:00Z', 'count': 1},
+                                                        {'time': '2017-12-12T09:00:00Z', 'count': 2},
+                                                        {'time': '2017-12-12T10:00:00Z', 'count': 4},
+                                                        {'time': '2017-12-12T11:00:00Z', 'count': 5}],
+                                                tags={'host': 'a'})])
+        self.assertEqual(result_cache.stats().partial_hits, 1)
+
+    def test_descending_is_refetched(self):
+        qs = RequestsMeasurement.series.filter(
+            time__gte=datetime(2017, 12, 12, 8)).resolution(Hours(1)).order_by('-time').cache(ttl=5)
+
+        with mock.patch('influxpy.queryset.client_wrapper') as wrapper, mock.patch('time.time') as now:
+            now.return_value = NOW
+            wrapper.query_raw.return_value = raw_result(['2017-12-12T10:00:00Z', 3],
+                                                        ['2017-12-12T09:00:00Z', 2])
+            list(qs)
+
+            now.return_value = NOW + 3600
+            wrapper.query_raw.return_value = raw_result(['2017-12-12T11:00:00Z', 5],
+                                                        ['2017-12-12T10:00:00Z', 4],
+                                                        ['2017-12-12T09:00:00Z', 2])
+            results = list(qs)
+
+        self.assertNotIn('2017-12-12T10:00:00Z', wrapper.query_raw.call_args[0][0])
+        self.assertEqual([point['time'][11:13] for point in results[0].points], ['11', '10', '09'])
+        self.assertEqual(result_cache.stats().partial_hits, 0)
+
+    def test_closed_buckets_never_expire(self):
+        qs = RequestsMeasurement.series.filter(
+            time__between=(datetime(2017, 12, 11), datetime(2017, 12, 11, 23))).resolution(Hours(1)).cache(ttl=5)
+
+        with mock.patch('influxpy.queryset.client_wrapper') as wrapper, mock.patch('time.time') as now:
+            now.return_value = NOW
+            wrapper.query_raw.return_value = raw_result(['2017-12-11T10:00:00Z', 1])
+            list(qs)
+            now.return_value = NOW + 86400
+            list(qs)
+
+        self.assertEqual(wrapper.query_raw.call_count, 1)
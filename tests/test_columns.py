@@ -0,0 +1,46 @@
+from array import array
+from unittest import TestCase, mock, skipIf
+
+from influxpy import columns
+from influxpy.columns import columns_from_raw, to_array
+
+RAW = {'statement_id': 0, 'series': [{
+    'name': 'server',
+    'tags': {'name': 'i-1'},
+    'columns': ['time', 'cpu', 'memory', 'region'],
+    'values': [[1513065600000000000, 1.5, 128, 'us-east-1'],
+               [1513069200000000000, None, 256, 'us-east-1']]
+}]}
+
+
+class ColumnsTest(TestCase):
+    def test_array_fallback(self):
+        with mock.patch.object(columns, 'numpy', None):
+            result = columns_from_raw(RAW)[0]
+
+        self.assertEqual(result.tags, {'name': 'i-1'})
+        self.assertEqual(len(result), 2)
+        self.assertEqual(result.columns['time'], array('q', [1513065600000000000, 1513069200000000000]))
+        self.assertEqual(result.columns['memory'], array('q', [128, 256]))
+        self.assertEqual(result.columns['cpu'][0], 1.5)
+        self.assertNotEqual(result.columns['cpu'][1], result.columns['cpu'][1])
+        self.assertEqual(result.columns['region'], ['us-east-1', 'us-east-1'])
+
+    @skipIf(columns.numpy is None, 'numpy is not installed')
+    def test_numpy(self):
+        result = columns_from_raw(RAW)[0]
+
+        self.assertEqual(result.columns['time'].dtype, columns.numpy.int64)
+        self.assertEqual(result.columns['cpu'].dtype, columns.numpy.float64)
+        self.assertEqual(result.columns['memory'].tolist(), [128, 256])
+        self.assertEqual(result.columns['region'].dtype, object)
+
+    def test_empty_series(self):
+        result = columns_from_raw({'series': [{'name': 'cpu', 'columns': ['time', 'value'], 'values': []}]})[0]
+
+        self.assertEqual(list(result.columns.keys()), ['time', 'value'])
+        self.assertEqual(len(result), 0)
+
+    def test_bool_column(self):
+        with mock.patch.object(columns, 'numpy', None):
+            self.assertEqual(to_array((True, False)), [True, False])
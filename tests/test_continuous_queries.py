@@ -0,0 +1,138 @@
+from unittest import TestCase
+
+from influxpy.aggregates import Count, Max, Sum
+from influxpy.fields import InfluxField, InfluxTag, Days, Hours
+from influxpy.management import RetentionPolicy, Rollup, plan, sync
+from influxpy.model import InfluxMeasurement
+from tests.stub import StubInfluxServer
+
+ONE_YEAR = RetentionPolicy('one_year', Days(365))
+
+
+class RequestMeasurement(InfluxMeasurement):
+    measurement = 'requests'
+
+    latency = InfluxField()
+    path = InfluxTag()
+
+    class Meta:
+        rollups = [
+            Rollup(Hours(1), 'requests_hour', retention_policy=ONE_YEAR, resample_for=Hours(2)),
+            Rollup(Days(1), 'requests_day', aggregates=[Sum('latency')], retention_policy=RetentionPolicy('forever')),
+        ]
+
+
+class CounterMeasurement(InfluxMeasurement):
+    measurement = 'counter'
+
+    hits = InfluxField()
+    peak = InfluxField()
+
+    class Meta:
+        rollups = [
+            Rollup(Hours(1), 'counter_hour', aggregates=[Count('hits'), Max('peak')]),
+            Rollup(Days(1), 'counter_day', aggregates=[Count('hits'), Max('peak')]),
+        ]
+
+
+def policies_response(*rows):
+    return {'results': [{'statement_id': 0, 'series': [{
+        'columns': ['name', 'duration', 'shardGroupDuration', 'replicaN', 'default'],
+        'values': [['autogen', '0s', '168h0m0s', 1, True]] + list(rows)}]}]}
+
+
+def queries_response(*names):
+    return {'results': [{'statement_id': 0, 'series': [
+        {'name': '_internal', 'columns': ['name', 'query'], 'values': [['cq_internal', '']]},
+        {'name': 'stub', 'columns': ['name', 'query'], 'values': [[name, ''] for name in names]}]}]}
+
+
+class ManagementTest(TestCase):
+    def plan(self, policies, queries, **kwargs):
+        with StubInfluxServer({'SHOW RETENTION POLICIES ON "stub"': policies,
+                               'SHOW CONTINUOUS QUERIES': queries}) as stub, stub.patch_client():
+            return plan(RequestMeasurement, **kwargs)
+
+    def test_rollups_are_downsampled_measurements(self):
+        self.assertEqual(RequestMeasurement._meta.aggregated_measurements, {
+            Hours(1): '"one_year"."requests_hour"',
+            Days(1): '"forever"."requests_day"',
+        })
+
+    def test_create(self):
+        operations = self.plan(policies_response(), queries_response())
+
+        self.assertEqual([operation[:2] for operation in operations], [
+            ('create', 'retention policy'),
+            ('create', 'retention policy'),
+            ('create', 'continuous query'),
+            ('create', 'continuous query'),
+        ])
+        self.assertEqual(operations[0].statement,
+                         'CREATE RETENTION POLICY "forever" ON "stub" DURATION INF REPLICATION 1')
+        self.assertEqual(operations[1].statement,
+                         'CREATE RETENTION POLICY "one_year" ON "stub" DURATION 365d REPLICATION 1')
+        self.assertRegex(operations[2].name, '^cq_requests_day_[0-9a-f]{8}$')
+        self.assertEqual(
+            operations[2].statement,
+            'CREATE CONTINUOUS QUERY "{}" ON "stub" BEGIN SELECT sum(latency) AS "latency" '
+            'INTO "forever"."requests_day" FROM requests GROUP BY time(1d), "path" END'.format(
+                operations[2].name))
+        self.assertEqual(
+            operations[3].statement,
+            'CREATE CONTINUOUS QUERY "{}" ON "stub" RESAMPLE FOR 2h BEGIN SELECT mean(latency) AS "latency" '
+            'INTO "one_year"."requests_hour" FROM requests GROUP BY time(1h), "path" END'.format(operations[3].name))
+
+    def test_rollups_read_their_own_aggregates(self):
+        day = CounterMeasurement._meta.rollups[1].continuous_query(CounterMeasurement, 'stub')
+        self.assertIn('SELECT sum(hits) AS "hits", max(peak) AS "peak" INTO counter_day FROM counter_hour ',
+                      day.iql_query())
+
+        qs = CounterMeasurement.series.resolution(Days(7)).use_downsampled()
+        self.assertIn('FROM counter_day ', qs.annotate(Count('hits'), Max('peak')).iql_query())
+        # the hourly fields hold counts and maxima, not sums.
+        self.assertIn('FROM counter ', qs.annotate(Sum('hits')).iql_query())
+        self.assertIn('FROM counter ', qs.annotate(Count('peak')).iql_query())
+        self.assertIn('FROM counter ', qs.annotate(Count('hits'), Sum('peak')).iql_query())
+
+    def test_sync_is_idempotent(self):
+        names = [operation.name for operation in self.plan(policies_response(), queries_response())[2:]]
+        operations = self.plan(
+            policies_response(['forever', '0s', '168h0m0s', 1, False], ['one_year', '8760h0m0s', '168h0m0s', 1, False]),
+            queries_response(*names))
+
+        self.assertEqual(operations, [])
+
+    def test_changed_definitions(self):
+        names = [operation.name for operation in self.plan(policies_response(), queries_response())[2:]]
+        operations = self.plan(
+            policies_response(['forever', '0s', '168h0m0s', 1, False], ['one_year', '720h0m0s', '168h0m0s', 1, False]),
+            queries_response(names[0], 'cq_requests_hour_0123abcd', 'cq_other'))
+
+        self.assertEqual([operation[:3] for operation in operations], [
+            ('alter', 'retention policy', 'one_year'),
+            ('drop', 'continuous query', 'cq_requests_hour_0123abcd'),
+            ('create', 'continuous query', names[1]),
+        ])
+        self.assertEqual(operations[1].statement, 'DROP CONTINUOUS QUERY "cq_requests_hour_0123abcd" ON "stub"')
+
+        pruned = self.plan(
+            policies_response(['forever', '0s', '168h0m0s', 1, False], ['one_year', '8760h0m0s', '168h0m0s', 1, False],
+                              ['old', '24h0m0s', '1h0m0s', 1, False]),
+            queries_response(*names + ['cq_other']), prune=True)
+
+        self.assertEqual([operation[:3] for operation in pruned], [
+            ('drop', 'continuous query', 'cq_other'),
+            ('drop', 'retention policy', 'old'),
+        ])
+
+    def test_sync(self):
+        with StubInfluxServer({'SHOW RETENTION POLICIES ON "stub"': policies_response(),
+                               'SHOW CONTINUOUS QUERIES': queries_response()}) as stub, stub.patch_client():
+            operations = sync(RequestMeasurement)
+            self.assertEqual([query['q'] for query in stub.queries[2:]],
+                             [operation.statement for operation in operations])
+
+            stub.queries.clear()
+            sync(RequestMeasurement, dry_run=True)
+            self.assertEqual(len(stub.queries), 2)
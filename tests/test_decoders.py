@@ -0,0 +1,112 @@
+import json
+import os
+import struct
+from unittest import TestCase, mock, skipIf
+
+from influxdb.exceptions import InfluxDBClientError
+
+from influxpy import decoders
+from influxpy.client import client_wrapper
+from influxpy.fields import InfluxField, InfluxTag
+from influxpy.model import InfluxMeasurement
+from influxpy.queryset import InfluxSeries
+from tests.stub import StubInfluxServer
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name), 'rb') as f:
+        return f.read()
+
+
+def epoch_extension(code, data):
+    seconds, nanoseconds = struct.unpack('>qi', data)
+    return seconds * 1000000000 + nanoseconds
+
+
+class CpuMeasurement(InfluxMeasurement):
+    measurement = 'cpu'
+
+    usage = InfluxField()
+    idle = InfluxField()
+    label = InfluxField()
+    host = InfluxTag()
+    region = InfluxTag()
+
+
+# cpu.csv and cpu.msgpack hold this response.
+CPU_SERIES = [
+    InfluxSeries(points=[{'time': '2017-12-12T08:00:00Z', 'usage': 0.5, 'idle': 7, 'label': 'x'},
+                         {'time': '2017-12-12T08:01:00.5Z', 'usage': None, 'idle': 3, 'label': 'y'}],
+                 tags={'host': 'a,1', 'region': 'eu'}),
+    InfluxSeries(points=[{'time': '2017-12-12T08:00:00Z', 'usage': 1.25, 'idle': 2, 'label': 'z'}],
+                 tags={'host': 'b', 'region': 'eu'}),
+]
+
+RESPONSE = {'results': [
+    {'statement_id': 0, 'series': [{'name': 'cpu', 'columns': ['time', 'value'], 'values': [[1, 0.5], [2, 7]]}]},
+    {'statement_id': 1},
+]}
+
+
+class DecodersTest(TestCase):
+    def test_parsers(self):
+        body = json.dumps(RESPONSE).encode('utf-8')
+        with mock.patch.object(decoders, 'orjson', None), mock.patch.object(decoders, 'ujson', None):
+            self.assertIs(decoders.get_json_loads(), json.loads)
+        self.assertEqual(decoders.decode_json(body), RESPONSE)
+
+    def test_query_raw(self):
+        with StubInfluxServer({'SELECT * FROM cpu; SHOW DATABASES': RESPONSE,
+                               'SELECT * FROM nope': {'results': [{'statement_id': 0, 'error': 'boom'}]}}) as server, \
+                server.patch_client():
+            self.assertEqual(client_wrapper.query_raw('SELECT * FROM cpu; SHOW DATABASES', epoch='s'),
+                             RESPONSE['results'])
+            with self.assertRaises(InfluxDBClientError):
+                client_wrapper.query_raw('SELECT * FROM nope')
+
+        self.assertEqual(server.queries[0]['epoch'], 's')
+
+    def fetch(self, qs, body, content_type):
+        with StubInfluxServer({qs.iql_query(): (body, {'Content-Type': content_type})}) as server, \
+                server.patch_client():
+            series = list(qs)
+        return series, server.requests[0][3]['Accept']
+
+    def test_csv(self):
+        series, accept = self.fetch(CpuMeasurement.series.response_format('csv'), fixture('cpu.csv'),
+                                    'application/csv')
+
+        self.assertEqual(accept, 'application/csv')
+        self.assertEqual(series, CPU_SERIES)
+        self.assertEqual(decoders.decode_csv(fixture('cpu.csv'), epoch='ns')['results'][0]['series'][1]['values'],
+                         [[1513065600000000000, 1.25, 2, 'z']])
+        self.assertEqual(decoders.decode_csv(b'error\r\nboom\r\n'), {'error': 'boom'})
+
+    @skipIf(decoders.msgpack is None, 'msgpack is not installed')
+    def test_msgpack(self):
+        qs = CpuMeasurement.series.response_format('msgpack')
+        # the response influxdb sends for epoch=ns, timestamps being integers instead of extension types.
+        body = decoders.msgpack.packb(decoders.msgpack.unpackb(fixture('cpu.msgpack'), raw=False,
+                                                               ext_hook=epoch_extension))
+
+        with StubInfluxServer({qs.iql_query(): (body, {'Content-Type': 'application/x-msgpack'})}) as server, \
+                server.patch_client():
+            self.assertEqual(list(qs), CPU_SERIES)
+            self.assertEqual(client_wrapper.query_raw(qs.iql_query(), epoch='ns', response_format='msgpack')[0]
+                             ['series'][1]['values'], [[1513065600000000000, 1.25, 2, 'z']])
+
+        self.assertEqual(server.requests[0][3]['Accept'], 'application/x-msgpack')
+        self.assertEqual([query.get('epoch') for query in server.queries], ['ns', 'ns'])
+        # the asyncio client decodes typed timestamps itself.
+        self.assertEqual(decoders.decode_msgpack(fixture('cpu.msgpack'))['results'][0]['series'][0]['values'][1][0],
+                         '2017-12-12T08:01:00.5Z')
+
+    def test_server_answering_json(self):
+        body = json.dumps({'results': [{'statement_id': 0}]}).encode('utf-8')
+        series, _ = self.fetch(CpuMeasurement.series.response_format('csv'), body, 'application/json')
+
+        self.assertEqual(series, [])
+        with self.assertRaises(ValueError):
+            CpuMeasurement.series.response_format('xml')
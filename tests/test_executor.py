@@ -0,0 +1,67 @@
+from datetime import datetime
+from unittest import TestCase
+
+from influxpy.executor import gather
+from influxpy.fields import Hours, InfluxField, InfluxTag
+from influxpy.model import InfluxMeasurement
+from tests.stub import StubInfluxServer
+
+
+class LoadMeasurement(InfluxMeasurement):
+    measurement = 'load'
+
+    value = InfluxField()
+    host = InfluxTag()
+
+
+def series(value, statement_id=0):
+    return {'statement_id': statement_id, 'series': [{
+        'name': 'load', 'columns': ['time', 'value'], 'values': [['2017-12-12T08:00:00Z', value]]}]}
+
+
+class GatherTest(TestCase):
+    def setUp(self):
+        self.querysets = [LoadMeasurement.series.filter(host=host) for host in ('a', 'b', 'c')]
+
+    def test_pack(self):
+        packed = '; '.join(qs.iql_query() for qs in self.querysets)
+        response = {'results': [series(1, 0), series(2, 1), series(3, 2)]}
+
+        with StubInfluxServer({packed: response}) as server, server.patch_client():
+            results = gather(*self.querysets)
+
+        self.assertEqual(len(server.queries), 1)
+        self.assertEqual([result[0].points[0]['value'] for result in results], [1, 2, 3])
+
+    def test_pack_without_results(self):
+        packed = '; '.join(qs.iql_query() for qs in self.querysets)
+
+        with StubInfluxServer({packed: {'results': []}}) as server, server.patch_client():
+            self.assertEqual(gather(*self.querysets), [[], [], []])
+
+    def test_pack_split(self):
+        split = LoadMeasurement.series.filter(
+            time__between=(datetime(2017, 12, 12, 8), datetime(2017, 12, 12, 12))
+        ).split_time(chunk=Hours(2))
+
+        with StubInfluxServer() as server, server.patch_client():
+            gather(split, *self.querysets)
+
+        self.assertEqual(sorted(query['q'] for query in server.queries), sorted([
+            '; '.join(qs.iql_query() for qs in self.querysets),
+            "SELECT * FROM load WHERE \"time\" >= '2017-12-12T08:00:00Z' AND \"time\" < '2017-12-12T10:00:00Z'",
+            "SELECT * FROM load WHERE \"time\" >= '2017-12-12T10:00:00Z' AND \"time\" <= '2017-12-12T12:00:00Z'",
+        ]))
+
+    def test_threads(self):
+        responses = {qs.iql_query(): {'results': [series(value)]} for value, qs in enumerate(self.querysets)}
+
+        with StubInfluxServer(responses) as server, server.patch_client():
+            results = gather(*self.querysets, mode='threads', max_workers=3)
+
+        self.assertEqual(len(server.queries), 3)
+        self.assertEqual([result[0].points[0]['value'] for result in results], [0, 1, 2])
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            gather(*self.querysets, mode='fork')
@@ -0,0 +1,47 @@
+from datetime import datetime, timezone, timedelta
+from unittest import TestCase
+
+from influxpy.fields import InfluxField, InfluxTag
+from influxpy.model import InfluxMeasurement
+
+
+class EscapedMeasurement(InfluxMeasurement):
+    measurement = 'disk usage,total'
+
+    used = InfluxField()
+    ratio = InfluxField()
+    label = InfluxField(null=True)
+    mounted = InfluxField(null=True)
+    path = InfluxTag()
+    host = InfluxTag(null=True)
+
+
+class LineProtocolTest(TestCase):
+    def test_encode(self):
+        point = EscapedMeasurement(used=10,
+                                   ratio=0.5,
+                                   label='say "hi"',
+                                   mounted=True,
+                                   path='/mnt/my disk,a=b',
+                                   time=datetime(2017, 12, 12, 8, 57, 22, 500))
+
+        self.assertEqual(
+            EscapedMeasurement._encoder.encode(point),
+            'disk\\ usage\\,total,path=/mnt/my\\ disk\\,a\\=b '
+            'label="say \\"hi\\"",mounted=true,ratio=0.5,used=10i 1513069042000500000')
+
+    def test_encode_aware_datetime(self):
+        point = EscapedMeasurement(used=1,
+                                   ratio=1.0,
+                                   path='/',
+                                   host='a',
+                                   time=datetime(2017, 12, 12, 9, 57, 22, tzinfo=timezone(timedelta(hours=1))))
+
+        self.assertEqual(EscapedMeasurement._encoder.encode_many([point]),
+                         b'disk\\ usage\\,total,host=a,path=/ ratio=1.0,used=1i 1513069042000000000\n')
+
+    def test_mandatory_field(self):
+        point = EscapedMeasurement(ratio=1.0, path='/', time=datetime(2017, 12, 12))
+
+        with self.assertRaises(RuntimeError):
+            EscapedMeasurement._encoder.encode(point)
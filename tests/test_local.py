@@ -0,0 +1,60 @@
+from unittest import TestCase, mock, skipIf
+
+from influxpy import aggregates, local
+from influxpy.aggregates import Mean, Raw, Sum
+from influxpy.columns import columns_from_raw
+from influxpy.fields import Hours
+from influxpy.local import aggregate
+from influxpy.queryset import InfluxSeries, row_class
+
+SERIES = [
+    InfluxSeries(points=[{'time': '2017-12-12T09:15:00Z', 'cpu': 1},
+                         {'time': '2017-12-12T10:15:00Z', 'cpu': None},
+                         {'time': '2017-12-12T10:30:00Z', 'cpu': 4}], tags={'region': 'eu', 'name': 'a'}),
+    InfluxSeries(points=[{'time': '2017-12-12T09:45:00Z', 'cpu': 2}], tags={'region': 'eu', 'name': 'b'}),
+    InfluxSeries(points=[{'time': '2017-12-12T09:00:00Z', 'cpu': 8}], tags={'region': 'us', 'name': 'c'}),
+]
+
+
+class LocalAggregateTest(TestCase):
+    def assert_regrouped(self):
+        results = aggregate(SERIES, Sum('cpu'), resolution=Hours(1), group_by=['region'], cpu=Mean('cpu'))
+
+        self.assertEqual(results, [
+            InfluxSeries(points=[{'time': '2017-12-12T09:00:00Z', 'sum': 3, 'cpu': 1.5},
+                                 {'time': '2017-12-12T10:00:00Z', 'sum': 4, 'cpu': 4.0}], tags={'region': 'eu'}),
+            InfluxSeries(points=[{'time': '2017-12-12T09:00:00Z', 'sum': 8, 'cpu': 8.0}], tags={'region': 'us'}),
+        ])
+
+    @skipIf(local.numpy is None, 'numpy is not installed')
+    def test_numpy(self):
+        self.assert_regrouped()
+
+    def test_python_fallback(self):
+        with mock.patch.object(local, 'numpy', None), mock.patch.object(aggregates, 'numpy', None):
+            self.assert_regrouped()
+
+    def test_without_resolution(self):
+        self.assertEqual(aggregate(SERIES, total=Sum('cpu')),
+                         [InfluxSeries(points=[{'time': '1970-01-01T00:00:00Z', 'total': 15}], tags=None)])
+
+    def test_columns(self):
+        columns = columns_from_raw({'series': [{'columns': ['time', 'cpu'],
+                                                'values': [[0, 1.0], [3600, None], [3700, 2.0], [60, 3.0]]}]})
+        result = aggregate(columns, Mean('cpu'), resolution=Hours(1), epoch='s')[0]
+
+        self.assertEqual(list(result.columns['time']), [0, 3600])
+        self.assertEqual(list(result.columns['mean']), [2.0, 2.0])
+
+    def test_values_list(self):
+        named = row_class(('time', 'cpu'))
+        rows = [InfluxSeries(points=[named(*point.values()) for point in serie.points], tags=serie.tags)
+                for serie in SERIES]
+
+        self.assertEqual(aggregate(rows, total=Sum('cpu')), aggregate(SERIES, total=Sum('cpu')))
+        with self.assertRaises(ValueError):
+            aggregate([InfluxSeries(points=[('2017-12-12T09:15:00Z', 1)], tags=None)], Sum('cpu'))
+
+    def test_raw_cannot_be_evaluated(self):
+        with self.assertRaises(RuntimeError):
+            aggregate(SERIES, Raw('max(cpu)'))
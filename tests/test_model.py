@@ -1,4 +1,8 @@
 from datetime import datetime, timedelta
+from unittest import mock
+from unittest.case import TestCase
+
+from influxdb.exceptions import InfluxDBServerError
 
 from influxpy.model import InfluxMeasurement, ContinuousQuery
 from influxpy.fields import InfluxField, InfluxTag, Hours, Days, Minutes
@@ -35,6 +39,33 @@ class ServerMeasurement(InfluxMeasurement):
     name = InfluxTag()
 
 
+class BulkSaveTest(TestCase):
+    def make_points(self, count):
+        pivot = datetime(2017, 12, 12, 8, 57, 22)
+        return [CounterMeasurement(time=pivot + timedelta(minutes=i),
+                                   organization=1,
+                                   project=2,
+                                   kind='map_load',
+                                   product='STORES',
+                                   counter=i) for i in range(count)]
+
+    def test_bulk_save_batches(self):
+        with mock.patch('influxpy.model.client_wrapper') as wrapper:
+            reports = CounterMeasurement.bulk_save(self.make_points(5), batch_size=2)
+
+        self.assertEqual([report.size for report in reports], [2, 2, 1])
+        self.assertEqual(wrapper.write_lines.call_count, 3)
+        self.assertEqual(wrapper.write_lines.call_args[0][0],
+                         b'counter,kind=map_load,organization=1,product=STORES,project=2 counter=4i 1513069282000000000\n')
+
+    def test_bulk_save_reports_failures(self):
+        with mock.patch('influxpy.model.client_wrapper') as wrapper:
+            wrapper.write_lines.side_effect = [None, InfluxDBServerError('boom'), None]
+            reports = CounterMeasurement.bulk_save(self.make_points(3), batch_size=1)
+
+        self.assertEqual([report.error is None for report in reports], [True, False, True])
+
+
 class ModelTest(InfluxTestCase):
     def test_server_model(self):
         pivot = datetime(2017, 12, 12, 8, 57, 22)
@@ -184,7 +215,7 @@ class ModelTest(InfluxTestCase):
                              resample_for=Days(2))
         self.assertEqual(
             cq.iql_query(),
-            'CREATE CONTINUOUS QUERY "cq_counter_day" ON influx RESAMPLE EVERY 1h FOR 2d BEGIN SELECT sum(counter) AS "counter" INTO counter_day FROM counter_minute GROUP BY time(1d), "organization", "project", "kind", "product" END')
+            'CREATE CONTINUOUS QUERY "cq_counter_day" ON influx RESAMPLE EVERY 1h FOR 2d BEGIN SELECT sum(counter) AS "counter" INTO counter_day FROM counter_hour GROUP BY time(1d), "organization", "project", "kind", "product" END')
 
     def test_model_save(self):
         point1 = CounterMeasurement(
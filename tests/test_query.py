@@ -21,26 +21,40 @@ class RealtimeCounter(InfluxMeasurement):
 
 
 class QueryTest(TestCase):
-    def test_query_deepcopy(self):
-        query = InfluxQuery()
-        query.filters = {
-            'toto': ['a']
-        }
+    def test_query_is_immutable(self):
+        query = InfluxQuery(filters={'toto': 'a'})
 
-        query_copy = copy.deepcopy(query)
+        query_copy = query.replace(filters=query.filters.update({'toto': 'b'}),
+                                   group_by=query.group_by + ('tag',),
+                                   annotations=(Sum('counter'),))
 
-        query_copy.filters['toto'].append('b')
-        query_copy.group_by.append('tag')
-        query_copy.annotations.append(Sum('counter'))
+        self.assertEqual(dict(query.filters.items()), {'toto': 'a'})
+        self.assertEqual(dict(query_copy.filters.items()), {'toto': 'b'})
 
-        self.assertEqual(query.filters, {'toto': ['a']})
-        self.assertEqual(query_copy.filters, {'toto': ['a', 'b']})
+        self.assertEqual(query.group_by, ())
+        self.assertEqual(query_copy.group_by, ('tag',))
 
-        self.assertEqual(query.group_by, [])
-        self.assertEqual(query_copy.group_by, ['tag'])
+        self.assertEqual(query.annotations, ())
+        self.assertEqual(query_copy.annotations, (Sum('counter'),))
 
-        self.assertEqual(query.annotations, [])
-        self.assertEqual(query_copy.annotations, [Sum('counter')])
+        with self.assertRaises(AttributeError):
+            query.fill = 0
+
+        self.assertIs(copy.deepcopy(query), query)
+
+    def test_clone_shares_query(self):
+        qs = RealtimeCounter.series.filter(product='STORES').group_by('product')
+        clone = qs.resolution(Days(1))
+
+        self.assertIs(clone.query.filters, qs.query.filters)
+        self.assertIs(clone.query.group_by, qs.query.group_by)
+        self.assertEqual(hash(clone.query), hash(qs.resolution(Days(1)).query))
+
+    def test_annotate_does_not_rename_shared_aggregate(self):
+        aggregate = Sum('counter')
+        RealtimeCounter.series.annotate(total=aggregate)
+
+        self.assertIsNone(aggregate.name)
 
     def test_query(self):
         qs = RealtimeCounter.series.filter(product='STORES',
@@ -1,8 +1,12 @@
-from unittest import TestCase
+import json
+from datetime import datetime
+from unittest import TestCase, mock
 
-from influxpy.fields import InfluxTag, Days
+from influxpy.aggregates import Derivative, Max, Mean, Min, MovingAverage, Raw, Sum
+from influxpy.fields import InfluxField, InfluxTag, Days, Hours, Minutes
 from influxpy.model import InfluxMeasurement
-from influxpy.queryset import InfluxQuerySet
+from influxpy.queryset import InfluxQuerySet, InfluxSeries
+from tests.stub import StubInfluxServer
 
 
 class TestModel(InfluxMeasurement):
@@ -12,6 +16,19 @@ class TestModel(InfluxMeasurement):
     project = InfluxTag()
 
 
+class DownsampledModel(InfluxMeasurement):
+    measurement = 'requests'
+
+    count = InfluxField()
+
+    class Meta:
+        aggregated_measurements = {
+            Days(1): 'requests_day',
+            Hours(1): 'requests_hour',
+            Minutes(1): 'requests_minute',
+        }
+
+
 class QuerySetTest(TestCase):
     def test_queryset(self):
         qs = TestModel.series.filter(organization=7, project=9)
@@ -23,3 +40,263 @@ class QuerySetTest(TestCase):
         self.assertEqual(
             qs.iql_query(),
             "SELECT * FROM cpu WHERE \"organization\" = '7' AND \"project\" = '9' GROUP BY time(1d), \"organization\", \"project\"")
+
+
+class StreamingTest(TestCase):
+    def test_iterator(self):
+        qs = TestModel.series.group_by('organization')
+        chunks = [
+            {'results': [{'statement_id': 0, 'series': [{
+                'name': 'cpu', 'tags': {'organization': '1'}, 'columns': ['time', 'value'],
+                'values': [['2017-12-12T08:00:00Z', 1], ['2017-12-12T09:00:00Z', 2]]}], 'partial': True}]},
+            {'results': [{'statement_id': 0, 'series': [{
+                'name': 'cpu', 'tags': {'organization': '1'}, 'columns': ['time', 'value'],
+                'values': [['2017-12-12T10:00:00Z', 3]]}]}]},
+        ]
+        body = b'\n'.join(json.dumps(chunk).encode('utf-8') for chunk in chunks) + b'\n'
+
+        with StubInfluxServer({qs.iql_query(): (body, {'Content-Type': 'application/json'})}) as server:
+            with server.patch_client():
+                results = list(qs.iterator(chunk_size=2))
+
+        self.assertEqual([len(serie.points) for serie in results], [2, 1])
+        self.assertEqual(results[1].points, [{'time': '2017-12-12T10:00:00Z', 'value': 3}])
+        self.assertEqual(server.queries[0]['chunked'], 'true')
+        self.assertEqual(server.queries[0]['chunk_size'], '2')
+
+
+class RowsTest(TestCase):
+    response = {'results': [{'statement_id': 0, 'series': [{
+        'name': 'cpu', 'tags': {'organization': '1'}, 'columns': ['time', 'project'],
+        'values': [['2017-12-12T08:00:00Z', '7'], ['2017-12-12T09:00:00.5Z', '9']]}]}]}
+
+    def test_values_list(self):
+        qs = TestModel.series.group_by('organization')
+
+        with StubInfluxServer({qs.iql_query(): self.response}) as server, server.patch_client():
+            tuples = list(qs.values_list())
+            named = list(qs.values_list(named=True))
+
+        self.assertEqual(tuples[0].points, [('2017-12-12T08:00:00Z', '7'), ('2017-12-12T09:00:00.5Z', '9')])
+        self.assertEqual(tuples[0].tags, {'organization': '1'})
+        self.assertEqual(named[0].points[1].project, '9')
+        self.assertEqual(named[0].points[1].time, '2017-12-12T09:00:00.5Z')
+
+    def test_instances(self):
+        qs = TestModel.series.group_by('organization')
+
+        with StubInfluxServer({qs.iql_query(): self.response}) as server, server.patch_client():
+            instances = list(qs.instances())
+
+        self.assertIsInstance(instances[0], TestModel)
+        self.assertEqual(instances[1].organization, '1')
+        self.assertEqual(instances[1].project, '9')
+        self.assertEqual(instances[1].time, datetime(2017, 12, 12, 9, 0, 0, 500000))
+
+    def test_no_result(self):
+        qs = TestModel.series.group_by('organization')
+
+        with StubInfluxServer({qs.iql_query(): {'results': []}}) as server, server.patch_client():
+            self.assertEqual(list(qs), [])
+            self.assertEqual(list(qs.values_list()), [])
+            self.assertEqual(list(qs.instances()), [])
+            self.assertEqual(qs.to_columns(), [])
+
+
+class CompilerCacheTest(TestCase):
+    def test_time_bounds_share_template(self):
+        compiler = TestModel.series.compiler
+        compiler.cache_clear()
+
+        first = TestModel.series.filter(organization=7, time__gte=datetime(2017, 12, 12)).resolution(Days(1))
+        second = TestModel.series.filter(organization=8, time__gte=datetime(2017, 12, 13)).resolution(Days(1))
+
+        self.assertEqual(
+            first.iql_query(),
+            "SELECT * FROM cpu WHERE \"organization\" = '7' AND \"time\" >= '2017-12-12T00:00:00Z' GROUP BY time(1d)")
+        self.assertEqual(
+            second.iql_query(),
+            "SELECT * FROM cpu WHERE \"organization\" = '8' AND \"time\" >= '2017-12-13T00:00:00Z' GROUP BY time(1d)")
+        self.assertEqual(compiler.cache_info().hits, 1)
+        self.assertEqual(compiler.cache_info().misses, 1)
+
+        self.assertEqual(TestModel.series.resolution(Days(2)).iql_query(), 'SELECT * FROM cpu GROUP BY time(2d)')
+        self.assertEqual(compiler.cache_info().misses, 2)
+
+    def test_cache_is_bounded(self):
+        compiler = TestModel.series.compiler
+        compiler.cache_clear()
+
+        with mock.patch.object(compiler, 'cache_size', 2):
+            for days in range(1, 5):
+                TestModel.series.resolution(Days(days)).iql_query()
+
+        self.assertEqual(compiler.cache_info().currsize, 2)
+
+
+class SplitTimeTest(TestCase):
+    def test_split_on_resolution(self):
+        qs = TestModel.series.filter(
+            time__between=(datetime(2017, 12, 12, 8, 30), datetime(2017, 12, 12, 13, 30))
+        ).group_by('organization').resolution(Hours(1)).split_time(max_points_per_chunk=2)
+
+        def query(iql, epoch=None, using=None, response_format=None):
+            hour = iql.split("\"time\" >= '2017-12-12T")[1][:2]
+            return [{'series': [{'name': 'cpu', 'tags': {'organization': '1'}, 'columns': ['time', 'hour'],
+                                 'values': [['2017-12-12T{}:00:00Z'.format(hour), int(hour)]]}]}]
+
+        with mock.patch('influxpy.queryset.client_wrapper') as wrapper:
+            wrapper.query_raw.side_effect = query
+            results = list(qs)
+
+        self.assertEqual(sorted(call[0][0] for call in wrapper.query_raw.call_args_list), [
+            "SELECT * FROM cpu WHERE \"time\" >= '2017-12-12T08:30:00Z' AND \"time\" < '2017-12-12T10:00:00Z' "
+            "GROUP BY time(1h), \"organization\"",
+            "SELECT * FROM cpu WHERE \"time\" >= '2017-12-12T10:00:00Z' AND \"time\" < '2017-12-12T12:00:00Z' "
+            "GROUP BY time(1h), \"organization\"",
+            "SELECT * FROM cpu WHERE \"time\" >= '2017-12-12T12:00:00Z' AND \"time\" <= '2017-12-12T13:30:00Z' "
+            "GROUP BY time(1h), \"organization\"",
+        ])
+        self.assertEqual(len(results), 1)
+        self.assertEqual([point['hour'] for point in results[0].points], [8, 10, 12])
+
+    def test_split_needs_bounds(self):
+        with self.assertRaises(RuntimeError):
+            list(TestModel.series.resolution(Hours(1)).split_time())
+
+    def test_split_aggregates_need_resolution(self):
+        qs = DownsampledModel.series.filter(
+            time__between=(datetime(2017, 1, 1), datetime(2017, 3, 1))
+        ).annotate(Mean('count')).split_time(chunk=Days(10))
+
+        with mock.patch('influxpy.queryset.client_wrapper') as wrapper:
+            with self.assertRaises(RuntimeError):
+                list(qs)
+        wrapper.query_raw.assert_not_called()
+
+    def test_split_transformations(self):
+        qs = DownsampledModel.series.filter(
+            time__between=(datetime(2017, 1, 1), datetime(2017, 1, 3))
+        ).resolution(Hours(1))
+
+        for annotation in (Derivative(Mean('count')), MovingAverage(Mean('count'), 3)):
+            with mock.patch('influxpy.queryset.client_wrapper') as wrapper:
+                with self.assertRaises(RuntimeError):
+                    list(qs.annotate(annotation).split_time(chunk=Hours(12)))
+            wrapper.query_raw.assert_not_called()
+
+
+class DownsampledPlannerTest(TestCase):
+    def test_coarsest_dividing_resolution(self):
+        qs = DownsampledModel.series.annotate(Sum('count')).use_downsampled()
+
+        self.assertEqual(qs.resolution(Hours(6)).iql_query(),
+                         'SELECT sum(count) FROM requests_hour GROUP BY time(6h)')
+        self.assertEqual(qs.resolution(Minutes(90)).iql_query(),
+                         'SELECT sum(count) FROM requests_minute GROUP BY time(90m)')
+        self.assertEqual(qs.resolution(Days(2)).iql_query(),
+                         'SELECT sum(count) FROM requests_day GROUP BY time(2d)')
+
+    def test_point_budget(self):
+        qs = DownsampledModel.series.filter(
+            time__between=(datetime(2017, 12, 1), datetime(2017, 12, 31))
+        ).annotate(Max('count'))
+
+        self.assertIn('FROM requests_hour ', qs.use_downsampled(max_points=1000).iql_query())
+        self.assertIn('FROM requests_day ', qs.use_downsampled(max_points=10).iql_query())
+        self.assertIn('FROM requests_minute ', qs.use_downsampled(max_points=100000).iql_query())
+
+    def test_mean_of_means_is_opt_in(self):
+        qs = DownsampledModel.series.annotate(Mean('count')).resolution(Hours(6))
+
+        self.assertEqual(qs.use_downsampled().iql_query(), 'SELECT mean(count) FROM requests GROUP BY time(6h)')
+        self.assertEqual(qs.use_downsampled(mean_of_means=True).iql_query(),
+                         'SELECT mean(count) FROM requests_hour GROUP BY time(6h)')
+
+    def test_fallback_to_raw_measurement(self):
+        self.assertEqual(DownsampledModel.series.annotate(Sum('count')).resolution(Hours(1)).iql_query(),
+                         'SELECT sum(count) FROM requests GROUP BY time(1h)')
+        self.assertEqual(DownsampledModel.series.annotate(Raw('max(count)')).resolution(Hours(1))
+                         .use_downsampled().iql_query(),
+                         'SELECT max(count) FROM requests GROUP BY time(1h)')
+        self.assertEqual(DownsampledModel.series.annotate(Sum('count')).resolution(Hours(1))
+                         .into('requests_hour').use_downsampled().iql_query(),
+                         'SELECT sum(count) INTO requests_hour FROM requests_minute GROUP BY time(1h)')
+
+
+class SlicingTest(TestCase):
+    def test_order_and_slices(self):
+        qs = TestModel.series.filter(organization=7).order_by('-time')
+
+        self.assertEqual(qs[:100].iql_query(),
+                         "SELECT * FROM cpu WHERE \"organization\" = '7' ORDER BY time DESC LIMIT 100")
+        self.assertEqual(qs[100:200][10:].iql_query(),
+                         "SELECT * FROM cpu WHERE \"organization\" = '7' ORDER BY time DESC LIMIT 90 OFFSET 110")
+        top_series = TestModel.series.resolution(Hours(1)).group_by('project').series_limit(5, 10)
+        self.assertEqual(top_series[50:].iql_query(),
+                         'SELECT * FROM cpu GROUP BY time(1h), "project" OFFSET 50 SLIMIT 5 SOFFSET 10')
+
+        with self.assertRaises(TypeError):
+            qs[0]
+        with self.assertRaises(ValueError):
+            qs[-10:]
+        with self.assertRaises(RuntimeError):
+            qs[:10].order_by('time')
+        with self.assertRaises(RuntimeError):
+            qs.order_by('organization')
+
+    def test_first_and_last(self):
+        with mock.patch('influxpy.queryset.client_wrapper') as wrapper:
+            wrapper.query_raw.return_value = [{'series': [{'columns': ['time', 'value'],
+                                                           'values': [['2017-12-12T00:00:00Z', 1]]}]}]
+            self.assertEqual(TestModel.series.last(),
+                             [InfluxSeries(points=[{'time': '2017-12-12T00:00:00Z', 'value': 1}], tags=None)])
+            TestModel.series.first()
+
+        self.assertEqual([call[0][0] for call in wrapper.query_raw.call_args_list],
+                         ['SELECT * FROM cpu ORDER BY time DESC LIMIT 1', 'SELECT * FROM cpu LIMIT 1'])
+
+    def test_empty_slices(self):
+        qs = TestModel.series.filter(organization=7)
+
+        with mock.patch('influxpy.queryset.client_wrapper') as wrapper:
+            for empty in (qs[:0], qs[5:5], qs[10:20][15:], qs.order_by('-time')[:0]):
+                self.assertEqual(list(empty), [])
+                self.assertEqual(empty.first(), [])
+                self.assertEqual(empty.last(), [])
+                self.assertEqual(list(empty.values_list()), [])
+                self.assertEqual(empty.to_columns(), [])
+                with self.assertRaises(RuntimeError):
+                    empty.iql_query()
+        wrapper.query_raw.assert_not_called()
+
+        self.assertEqual(qs[10:20][5:].iql_query(),
+                         "SELECT * FROM cpu WHERE \"organization\" = '7' LIMIT 5 OFFSET 15")
+
+    def test_sliced_queries_are_not_split(self):
+        with self.assertRaises(RuntimeError):
+            list(TestModel.series.filter(time__between=(datetime(2017, 12, 12), datetime(2017, 12, 13)))
+                 .resolution(Hours(1)).split_time()[:10])
+
+
+class ProjectionTest(TestCase):
+    def test_only(self):
+        self.assertEqual(DownsampledModel.series.only('time', 'count').iql_query(), 'SELECT "count" FROM requests')
+        self.assertEqual(TestModel.series.values('organization').annotate(Raw('max(value)')).iql_query(),
+                         'SELECT "organization", max(value) FROM cpu')
+
+    def test_projection_with_aggregates(self):
+        qs = DownsampledModel.series.values('count')
+
+        self.assertEqual(qs.annotate(peak=Max('count')).iql_query(),
+                         'SELECT "count", max(count) AS "peak" FROM requests')
+        with self.assertRaises(ValueError):
+            qs.annotate(Mean('count')).iql_query()
+        with self.assertRaises(ValueError):
+            qs.annotate(Max('count'), Min('count')).iql_query()
+
+    def test_unknown_or_tag_only_projection(self):
+        with self.assertRaises(RuntimeError):
+            DownsampledModel.series.only('size').iql_query()
+        with self.assertRaises(RuntimeError):
+            TestModel.series.only('organization').iql_query()